@@ -3,16 +3,68 @@ from state_tracker import state_tracker
 from mqueue import NATSComm
 from mqueue_handler import MessagingQueueHandler
 from schedule_interpreter import ScheduleInterpreter
+from execution_journal import ExecutionJournal
+from schedule_watcher import ScheduleFileWatcher
+from schedule_compactor import ScheduleCompactor
+from clock_monitor import ClockMonitor
+from timezone_resolver import TimezoneResolver
+from solar import SolarTable
+from loop_monitor import LoopMonitor
+from leader_lease import LeaderElection, LockFileLease, NatsKvLease, default_replica_id
 
-mqueue_handler = MessagingQueueHandler()
+mqueue_handler = MessagingQueueHandler(settings.mQueueCoalesceWindowSecs, settings.heartbeatReport)
 
 mqueue = NATSComm(
     nat_servers=settings.mQueueServers,
     client_id=settings.mQueueClientID,
     subject_root=settings.mQueueSubjectRoot,
     mqueue_handler=mqueue_handler,
+    lane_sizes={"control": settings.mQueueControlLaneSize, "state": settings.mQueueStateLaneSize, "log": settings.mQueueLogLaneSize},
+    reconnect_min_secs=settings.mQueueReconnectMinSecs,
+    reconnect_max_secs=settings.mQueueReconnectMaxSecs,
 )
-schedule_interpreter = ScheduleInterpreter(mqueue_handler, state_tracker)
+execution_journal = ExecutionJournal(settings.executionJournalFile)
+replica_id = settings.haReplicaId or default_replica_id()
+if settings.haMode == "lockfile":
+    leader_election = LeaderElection(LockFileLease(settings.haLockFile, replica_id), settings.haLeaseTtlSecs, settings.haRenewIntervalSecs)
+elif settings.haMode == "nats":
+    leader_election = LeaderElection(NatsKvLease(mqueue, settings.haKvBucket, f"{settings.mQueueClientID}_leader", settings.haLeaseTtlSecs, replica_id), settings.haLeaseTtlSecs, settings.haRenewIntervalSecs)
+else:
+    leader_election = None
+clock_monitor = ClockMonitor(settings.clockCheckIntervalSecs)
+tz_resolver = TimezoneResolver(settings.schedulerTimezone, settings.dstSkippedTimePolicy, settings.dstAmbiguousTimePolicy)
+solar_table = SolarTable(settings.latitude, settings.longitude, tz_resolver.tz) if settings.latitude is not None and settings.longitude is not None else None
+schedule_interpreter = ScheduleInterpreter(
+    mqueue_handler,
+    state_tracker,
+    execution_journal,
+    clock_monitor,
+    settings.unsyncedClockPolicy,
+    tz_resolver,
+    leader_election=leader_election,
+    catch_up_max_secs=settings.haCatchUpMaxSecs,
+    command_ack=settings.commandAck,
+    ack_timeout=settings.commandAckTimeoutSecs,
+    ack_retries=settings.commandAckRetries,
+    ack_backoff_max=settings.commandAckBackoffMaxSecs,
+    command_diff=settings.commandDiff,
+    compile_process_threshold=settings.scheduleCompileProcessThreshold,
+    solar_table=solar_table,
+    execution_policy=settings.executionOverlapPolicy,
+)
+loop_monitor = LoopMonitor(settings.loopLagSampleSecs, settings.loopBlockThresholdSecs)
+schedule_watcher = ScheduleFileWatcher(schedule_interpreter, settings.scheduleWatchMode, settings.scheduleWatchPollSecs)
+schedule_compactor = ScheduleCompactor(schedule_interpreter, settings.scheduleArchiveFile, settings.scheduleArchiveRetentionDays)
 mqueue_handler.schedule_interpreter = schedule_interpreter
 mqueue_handler.mqueue_sender = mqueue
-state_tracker.mqueue_handler = mqueue_handler
\ No newline at end of file
+state_tracker.mqueue_handler = mqueue_handler
+mqueue_handler.register_health_provider("loop_lag", loop_monitor.get_stats)
+mqueue_handler.register_health_provider("nats_pending_bytes", mqueue.get_pending_bytes)
+mqueue_handler.register_health_provider("outbound_queue_depth", mqueue.get_outbound_queue_depth)
+mqueue_handler.register_health_provider("outbound", mqueue.get_outbound_status)
+mqueue_handler.register_health_provider("coalescing", mqueue_handler.get_coalescing_stats)
+mqueue_handler.register_health_provider("routes", mqueue_handler.get_route_stats)
+mqueue_handler.register_health_provider("scheduler", schedule_interpreter.get_health)
+mqueue_handler.register_health_provider("schedule_compaction", schedule_compactor.get_status)
+if leader_election:
+    mqueue_handler.register_health_provider("ha", leader_election.get_status)
\ No newline at end of file
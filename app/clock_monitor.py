@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime
+from dunebugger_logging import logger
+from utils import read_clock_sync_status
+
+
+class ClockMonitor:
+    """Periodically read the kernel clock synchronisation status and cache it.
+
+    The scheduler checks the cached value before executing, so no process is spawned
+    and nothing blocks on the event loop.
+    """
+
+    def __init__(self, check_interval=60):
+        self.check_interval = check_interval
+        self.synchronized = None  # None until the status has been read successfully
+        self.offset_secs = None
+        self.max_error_secs = None
+        self.est_error_secs = None
+        self.last_check = None
+        self.monitor_task = None
+
+    def refresh(self):
+        """Read the clock status now and update the cached values."""
+        clock_status = read_clock_sync_status()
+        self.last_check = datetime.now()
+        if clock_status is None:
+            self.synchronized = None
+            return
+
+        was_synchronized = self.synchronized
+        self.synchronized = clock_status["synchronized"]
+        self.offset_secs = clock_status["offset_secs"]
+        self.max_error_secs = clock_status["max_error_secs"]
+        self.est_error_secs = clock_status["est_error_secs"]
+
+        if self.synchronized != was_synchronized:
+            if self.synchronized:
+                logger.info(f"System clock synchronized (offset {self.offset_secs:.6f}s, estimated error {self.est_error_secs:.6f}s)")
+            else:
+                logger.warning(f"System clock not synchronized (maximum error {self.max_error_secs:.3f}s)")
+
+    def is_synchronized(self):
+        """Return True or False, or None when the status is unknown."""
+        return self.synchronized
+
+    def get_status(self):
+        return {
+            "synchronized": self.synchronized,
+            "offset_secs": self.offset_secs,
+            "max_error_secs": self.max_error_secs,
+            "est_error_secs": self.est_error_secs,
+            "last_check": self.last_check.isoformat() if self.last_check else None,
+        }
+
+    async def start_monitoring(self):
+        """Start the clock monitoring task"""
+        self.refresh()
+        self.monitor_task = asyncio.create_task(self._monitor_clock())
+
+    async def stop_monitoring(self):
+        """Stop the clock monitoring task"""
+        if self.monitor_task:
+            self.monitor_task.cancel()
+            try:
+                await self.monitor_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _monitor_clock(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error reading clock status: {e}")
@@ -0,0 +1,499 @@
+import calendar
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from datetime import date, time
+from solar import SUNRISE, SUNSET
+
+# Map Italian weekday section names to Python weekday numbers
+WEEKDAY_MAP = {
+    'lunedì': 0, 'martedì': 1, 'mercoledì': 2, 'giovedì': 3,
+    'venerdì': 4, 'sabato': 5, 'domenica': 6
+}
+
+# Entry kinds: a fixed time of the day, or an offset from a solar event
+FIXED = 0
+SOLAR_EVENTS = {'sunrise': SUNRISE, 'sunset': SUNSET}
+
+
+class DayTable:
+    """Entries of one schedule section as parallel arrays sorted by time.
+
+    minutes holds the minute of the day of each entry and action_ids indexes into
+    the action table shared by the whole compiled schedule.
+    Tables with sunrise/sunset entries also have kinds, and minutes holds the signed
+    offset from the solar event for those entries; kinds is None for fixed-time tables.
+    """
+
+    __slots__ = ("minutes", "action_ids", "raw_times", "actions", "kinds")
+
+    def __init__(self, minutes, action_ids, raw_times, actions, kinds=None):
+        self.minutes = minutes
+        self.action_ids = action_ids
+        self.raw_times = raw_times
+        self.actions = actions
+        self.kinds = kinds
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def get_time(self, index):
+        """Time of a fixed-time entry."""
+        minute = self.minutes[index]
+        return time(minute // 60, minute % 60)
+
+    def get_action(self, index):
+        return self.actions[self.action_ids[index]]
+
+    def get_day_times(self, day, solar_table):
+        """Return (time, index) of the entries that happen on day, in chronological order.
+
+        Solar entries are skipped when there is no solar_table, when the event does not
+        happen on that day, or when the offset moves them out of the day.
+        """
+        if self.kinds is None:
+            return [(self.get_time(index), index) for index in range(len(self.minutes))]
+
+        entries = []
+        for index in range(len(self.minutes)):
+            minute = self.minutes[index]
+            kind = self.kinds[index]
+            if kind != FIXED:
+                event_minute = solar_table.get_minute(day, kind) if solar_table else None
+                if event_minute is None:
+                    continue
+                minute += event_minute
+                if not 0 <= minute < 1440:
+                    continue
+            entries.append((minute, index))
+        entries.sort()
+        return [(time(minute // 60, minute % 60), index) for minute, index in entries]
+
+    def to_items(self, day=None, solar_table=None):
+        """Return the entries in the historical list-of-dicts shape.
+
+        Without a day, solar entries are listed with a None time.
+        """
+        if self.kinds is None or day is None:
+            return [{"time": self.get_time(index) if self.kinds is None or self.kinds[index] == FIXED else None, "action": self.get_action(index), "raw_time": self.raw_times[index]} for index in range(len(self.minutes))]
+        return [{"time": entry_time, "action": self.get_action(index), "raw_time": self.raw_times[index]} for entry_time, index in self.get_day_times(day, solar_table)]
+
+
+class CompiledSchedule:
+    """Compact compiled schedule: interned action names and one DayTable per section.
+
+    Sections with identical entries share the same DayTable instance.
+    """
+
+    __slots__ = ("actions", "weekdays", "special_dates", "_action_ids", "_tables", "_action_entries")
+
+    def __init__(self):
+        self.actions = []
+        self.weekdays = {}
+        self.special_dates = {}
+        self._action_ids = {}
+        self._tables = {}
+        self._action_entries = None  # reverse index, action id -> entries, built on first use
+
+    def intern_action(self, action):
+        """Return the id of an action name, adding it to the action table if needed."""
+        action_id = self._action_ids.get(action)
+        if action_id is None:
+            action_id = self._action_ids[action] = len(self.actions)
+            self.actions.append(sys.intern(action))
+        return action_id
+
+    def add_section(self, section_type, section_key, entries):
+        """Store a section from (kind, minute, action, raw_time) entries sorted by kind and minute."""
+        minutes = array("h", (minute for _kind, minute, _action, _raw_time in entries))
+        action_ids = array("H", (self.intern_action(action) for _kind, _minute, action, _raw_time in entries))
+        raw_times = tuple(sys.intern(raw_time) for _kind, _minute, _action, raw_time in entries)
+        kinds = array("B", (kind for kind, _minute, _action, _raw_time in entries))
+        if not any(kinds):
+            kinds = None
+
+        if self._tables is None:
+            self._tables = {}
+        table_key = (minutes.tobytes(), action_ids.tobytes(), raw_times, kinds.tobytes() if kinds else None)
+        table = self._tables.get(table_key)
+        if table is None:
+            table = self._tables[table_key] = DayTable(minutes, action_ids, raw_times, self.actions, kinds)
+
+        if section_type == "weekdays":
+            self.weekdays[section_key] = table
+        else:
+            self.special_dates[section_key] = table
+
+    def finish(self):
+        """Drop the lookup used to share identical sections once compilation is done."""
+        self._tables = None
+
+    def get_action_entries(self, action):
+        """Return (section type, section key, entry index) of every entry scheduling action."""
+        if self._action_entries is None:
+            self._action_entries = {}
+            for section_type, sections in (("weekdays", self.weekdays), ("special_dates", self.special_dates)):
+                for section_key, table in sections.items():
+                    for index in range(len(table)):
+                        self._action_entries.setdefault(table.action_ids[index], []).append((section_type, section_key, index))
+        action_id = self._action_ids.get(action)
+        return self._action_entries.get(action_id, []) if action_id is not None else []
+
+    def drop_special_dates_before(self, day):
+        """Remove the special dates earlier than day, returning their keys."""
+        expired = []
+        for key in self.special_dates:
+            day_num, month, year = (int(part) for part in key.split("-"))
+            if date(year, month, day_num) < day:
+                expired.append(key)
+        for key in expired:
+            del self.special_dates[key]
+        if expired:
+            self._action_entries = None
+        return expired
+
+    def get_day_table(self, day):
+        """Get the table of a date, a special date overrides the weekday schedule."""
+        table = self.special_dates.get(day.strftime("%d-%m-%Y"))
+        if table is None:
+            table = self.weekdays.get(day.weekday())
+        return table
+
+    def __bool__(self):
+        return bool(self.weekdays or self.special_dates)
+
+
+def _looks_like_date(section_name):
+    """Check if section name looks like a DD-MM-YYYY or DD/MM/YYYY date, valid or not."""
+    return bool(re.match(r'^\d{1,2}[-/]\d{1,2}[-/]\d{4}$', section_name))
+
+
+def _parse_special_date(section_name):
+    """Return the DD-MM-YYYY key of a special date section, or None if it is not a valid date."""
+    match = re.match(r'^(\d{1,2})[-/](\d{1,2})[-/](\d{4})$', section_name)
+    if not match:
+        return None
+    day, month, year = (int(group) for group in match.groups())
+    if year < 1 or not 1 <= month <= 12 or not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+    return f"{day:02d}-{month:02d}-{year}"
+
+
+def _check_action(action, state_names):
+    """Return the reason why an action cannot be scheduled, or None if it is valid."""
+    if not action:
+        return "Missing state name"
+    if state_names is None:
+        return f"States list not loaded, cannot validate state '{action}'"
+    if action not in state_names:
+        return f"State '{action}' not found in states list"
+    return None
+
+
+def _diagnostic(level, line_num, section, time_str, reason):
+    return {'level': level, 'line': line_num, 'section': section, 'time': time_str, 'reason': reason}
+
+
+def _parse_entry_time(line):
+    """Split an entry line into ((kind, minute, raw time, action), None), or (None, reason) if it is invalid.
+
+    minute is the minute of the day of fixed entries, and the signed offset in minutes
+    from the event of sunrise/sunset entries.
+    """
+    time_match = re.match(r'^(\d{1,2}):(\d{1,2})(?!\d)\s*(.*)$', line)
+    if time_match:
+        raw_time = f"{time_match.group(1)}:{time_match.group(2)}"
+        hour, minute = int(time_match.group(1)), int(time_match.group(2))
+        if hour > 23 or minute > 59:
+            return None, "Invalid time, hours must be 0-23 and minutes 0-59"
+        return (FIXED, hour * 60 + minute, raw_time, time_match.group(3).strip()), None
+
+    solar_match = re.match(r'^(sunrise|sunset)(?:([+-])(\d{1,2}):(\d{1,2}))?(?![\w:+-])\s*(.*)$', line, re.IGNORECASE)
+    if solar_match:
+        event, sign, hours, minutes, action = solar_match.groups()
+        raw_time = f"{event.lower()}{sign}{hours}:{minutes}" if sign else event.lower()
+        offset = 0
+        if sign:
+            if int(hours) > 23 or int(minutes) > 59:
+                return None, "Invalid offset, hours must be 0-23 and minutes 0-59"
+            offset = (int(hours) * 60 + int(minutes)) * (-1 if sign == '-' else 1)
+        return (SOLAR_EVENTS[event.lower()], offset, raw_time, action.strip()), None
+
+    return None, "Malformed line, expected 'HH:MM state' or 'sunrise|sunset[+-HH:MM] state'"
+
+
+def compile_schedule(content, state_names, solar=True):
+    """Parse schedule content in a single pass, collecting every error and warning.
+
+    state_names is the set of valid state names, or None when the states list is not loaded.
+    solar tells whether sunrise/sunset entries can be resolved, they are errors otherwise.
+    Depends on nothing else, so it can run in a worker process.
+    Returns the schedule built from the valid entries and the list of diagnostics.
+    Each diagnostic is a dict with level ('error' or 'warning'), line, section, time and reason.
+    """
+    sections = {}
+    diagnostics = []
+    section_lines = {}
+    current_section = None
+    schedule_items = None
+    seen_times = {}
+    entry_level = 'error'
+
+    for line_num, line in enumerate(content.splitlines(), 1):
+        line = line.strip()
+        
+        # Skip empty lines and comments
+        if not line or line.startswith('#'):
+            continue
+        
+        # Check for section headers
+        if line.startswith('[') and line.endswith(']'):
+            current_section = line[1:-1].strip()
+            schedule_items = None
+            seen_times = {}
+            entry_level = 'error'
+
+            special_date = _parse_special_date(current_section)
+            if special_date:
+                section_type, section_key = 'special_dates', special_date
+            elif _looks_like_date(current_section):
+                diagnostics.append(_diagnostic('error', line_num, current_section, None, "Invalid date, expected an existing DD-MM-YYYY date"))
+                continue
+            elif current_section.lower() in WEEKDAY_MAP:
+                section_type, section_key = 'weekdays', WEEKDAY_MAP[current_section.lower()]
+            else:
+                diagnostics.append(_diagnostic('warning', line_num, current_section, None, "Unknown section name, its entries are ignored"))
+                # Its entries cannot break the schedule, their problems are reported as warnings
+                entry_level = 'warning'
+                continue
+
+            if (section_type, section_key) in section_lines:
+                previous_line = section_lines[(section_type, section_key)]
+                diagnostics.append(_diagnostic('warning', line_num, current_section, None, f"Section already defined at line {previous_line}, this definition replaces it"))
+
+            # Start new section
+            section_lines[(section_type, section_key)] = line_num
+            schedule_items = []
+            sections[(section_type, section_key)] = schedule_items
+            continue
+
+        if current_section is None:
+            diagnostics.append(_diagnostic('warning', line_num, None, None, "Entry outside of any section, ignored"))
+            continue
+        # Entries of an invalid or unknown section (schedule_items is None) are still validated,
+        # so every problem is reported in one pass, but they are not stored
+
+        # Parse time and action lines
+        entry, reason = _parse_entry_time(line)
+        if reason:
+            diagnostics.append(_diagnostic(entry_level, line_num, current_section, line.split()[0], reason))
+            continue
+        kind, minute, time_str, action = entry
+        if kind != FIXED and not solar:
+            diagnostics.append(_diagnostic(entry_level, line_num, current_section, time_str, "Sunrise/sunset entries need the scheduler latitude and longitude to be configured"))
+            continue
+
+        # Check for duplicates in this section
+        if (kind, minute) in seen_times:
+            diagnostics.append(_diagnostic('warning', line_num, current_section, time_str, f"Duplicate time, already defined at line {seen_times[(kind, minute)]} - skipping"))
+            continue
+
+        reason = _check_action(action, state_names)
+        if reason:
+            diagnostics.append(_diagnostic(entry_level, line_num, current_section, time_str, reason))
+            continue
+
+        seen_times[(kind, minute)] = line_num
+        if schedule_items is not None:
+            schedule_items.append((kind, minute, action, time_str))
+
+    # Sort sections by time and drop empty ones, they would hide the weekday schedule
+    schedule = CompiledSchedule()
+    for (section_type, section_key), entries in sections.items():
+        if entries:
+            entries.sort(key=lambda entry: (entry[0], entry[1]))
+            schedule.add_section(section_type, section_key, entries)
+    schedule.finish()
+
+    # Check that all weekdays are present
+    missing = [name for name, weekday_num in WEEKDAY_MAP.items() if weekday_num not in schedule.weekdays]
+    if missing:
+        diagnostics.append(_diagnostic('warning', None, None, None, f"Missing weekdays: {', '.join(missing)}"))
+
+    return schedule, diagnostics
+
+
+def split_expired_sections(content, before):
+    """Split special-date sections dated before the date before out of schedule content.
+
+    A section is its header, the comments and blank lines right above it, and every line up to
+    the next one. Returns the remaining content, the text of the expired sections and their
+    DD-MM-YYYY keys; the remaining content is unchanged apart from the removed sections.
+    """
+    kept = []
+    expired = []
+    expired_keys = []
+    current = kept
+    pending = []  # comments and blank lines, they belong to the next header if one follows
+    for line in content.splitlines(keepends=True):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            pending.append(line)
+            continue
+        if stripped.startswith('[') and stripped.endswith(']'):
+            special_date = _parse_special_date(stripped[1:-1].strip())
+            current = kept
+            if special_date:
+                day, month, year = (int(part) for part in special_date.split('-'))
+                if date(year, month, day) < before:
+                    current = expired
+                    expired_keys.append(special_date)
+        current.extend(pending)
+        pending = []
+        current.append(line)
+    current.extend(pending)
+    return "".join(kept), "".join(expired), expired_keys
+
+
+# Binary cache of a compiled schedule, memory-mapped at startup instead of parsing schedule.conf:
+#   header, string tables (actions then raw times), day tables as 16-bit arrays, section maps
+CACHE_MAGIC = b"DBSC"
+CACHE_VERSION = 2
+CACHE_HEADER = struct.Struct("<4sHH32s16sIIIII")  # magic, version, reserved, source hash, states version, counts
+TABLE_HEADER = struct.Struct("<IBxxx")  # entries, has kinds
+WEEKDAY_ENTRY = struct.Struct("<BxxxI")
+SPECIAL_DATE_ENTRY = struct.Struct("<10sxxI")
+
+
+def _pack_strings(strings):
+    chunks = []
+    for string in strings:
+        encoded = string.encode("utf-8")
+        chunks.append(struct.pack("<H", len(encoded)))
+        chunks.append(encoded)
+    blob = b"".join(chunks)
+    # Keep the 16-bit arrays that follow aligned
+    return blob + b"\x00" * (len(blob) % 2)
+
+
+def _unpack_strings(buffer, offset, count):
+    strings = []
+    for _index in range(count):
+        (length,) = struct.unpack_from("<H", buffer, offset)
+        offset += 2
+        strings.append(sys.intern(bytes(buffer[offset : offset + length]).decode("utf-8")))
+        offset += length
+    return strings, offset + offset % 2
+
+
+def save_compiled_schedule(schedule, cache_file, source_hash, states_version):
+    """Write a compiled schedule to cache_file, atomically replacing any previous cache."""
+    tables = []
+    table_index = {}
+    for table in list(schedule.weekdays.values()) + list(schedule.special_dates.values()):
+        if id(table) not in table_index:
+            table_index[id(table)] = len(tables)
+            tables.append(table)
+
+    raw_times = []
+    raw_time_ids = {}
+    for table in tables:
+        for raw_time in table.raw_times:
+            if raw_time not in raw_time_ids:
+                raw_time_ids[raw_time] = len(raw_times)
+                raw_times.append(raw_time)
+
+    chunks = [
+        CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, 0, bytes.fromhex(source_hash), states_version, len(schedule.actions), len(raw_times), len(tables), len(schedule.weekdays), len(schedule.special_dates)),
+        _pack_strings(schedule.actions),
+        _pack_strings(raw_times),
+    ]
+    for table in tables:
+        chunks.append(TABLE_HEADER.pack(len(table), table.kinds is not None))
+        chunks.append(array("h", table.minutes).tobytes())
+        chunks.append(array("H", table.action_ids).tobytes())
+        chunks.append(array("H", (raw_time_ids[raw_time] for raw_time in table.raw_times)).tobytes())
+        if table.kinds is not None:
+            # Keep the following arrays aligned
+            chunks.append(array("B", table.kinds).tobytes() + b"\x00" * (len(table) % 2))
+    for weekday, table in schedule.weekdays.items():
+        chunks.append(WEEKDAY_ENTRY.pack(weekday, table_index[id(table)]))
+    for date_key, table in schedule.special_dates.items():
+        chunks.append(SPECIAL_DATE_ENTRY.pack(date_key.encode("ascii"), table_index[id(table)]))
+
+    temp_fd, temp_file = tempfile.mkstemp(prefix="schedule_cache_", dir=os.path.dirname(cache_file))
+    try:
+        with os.fdopen(temp_fd, "wb") as f:
+            f.write(b"".join(chunks))
+            # On disk before the rename, so a power cut cannot leave a torn cache in place
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, cache_file)
+    except Exception:
+        os.unlink(temp_file)
+        raise
+
+
+def load_compiled_schedule(cache_file, source_hash, states_version):
+    """Map cache_file and return its compiled schedule, or None if it is missing, stale or corrupt.
+
+    Day tables are 16-bit views straight into the mapping, nothing is parsed.
+    """
+    try:
+        with open(cache_file, "rb") as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if len(buffer) < CACHE_HEADER.size:
+        return None
+    magic, version, _reserved, cached_hash, cached_states, n_actions, n_raw_times, n_tables, n_weekdays, n_special = CACHE_HEADER.unpack_from(buffer, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION or cached_hash != bytes.fromhex(source_hash) or cached_states != states_version:
+        return None
+
+    try:
+        return _decode_compiled_schedule(buffer, n_actions, n_raw_times, n_tables, n_weekdays, n_special)
+    except (struct.error, IndexError, TypeError, ValueError):
+        # Truncated or corrupt, the schedule is parsed again and the cache rewritten
+        return None
+
+
+def _decode_compiled_schedule(buffer, n_actions, n_raw_times, n_tables, n_weekdays, n_special):
+    schedule = CompiledSchedule()
+    actions, offset = _unpack_strings(buffer, CACHE_HEADER.size, n_actions)
+    raw_times, offset = _unpack_strings(buffer, offset, n_raw_times)
+    schedule.actions.extend(actions)
+    schedule._action_ids = {action: action_id for action_id, action in enumerate(actions)}
+
+    tables = []
+    for _index in range(n_tables):
+        entries, has_kinds = TABLE_HEADER.unpack_from(buffer, offset)
+        offset += TABLE_HEADER.size
+        size = entries * 2
+        minutes = buffer[offset : offset + size].cast("h")
+        action_ids = buffer[offset + size : offset + 2 * size].cast("H")
+        raw_time_ids = buffer[offset + 2 * size : offset + 3 * size].cast("H")
+        offset += 3 * size
+        kinds = None
+        if has_kinds:
+            kinds = buffer[offset : offset + entries]
+            offset += entries + entries % 2
+        if offset > len(buffer):
+            raise ValueError("truncated day table")
+        tables.append(DayTable(minutes, action_ids, tuple(raw_times[raw_time_id] for raw_time_id in raw_time_ids), schedule.actions, kinds))
+
+    for _index in range(n_weekdays):
+        weekday, table_id = WEEKDAY_ENTRY.unpack_from(buffer, offset)
+        offset += WEEKDAY_ENTRY.size
+        schedule.weekdays[weekday] = tables[table_id]
+    for _index in range(n_special):
+        date_key, table_id = SPECIAL_DATE_ENTRY.unpack_from(buffer, offset)
+        offset += SPECIAL_DATE_ENTRY.size
+        schedule.special_dates[date_key.decode("ascii")] = tables[table_id]
+
+    schedule.finish()
+    return schedule
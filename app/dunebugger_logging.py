@@ -18,19 +18,63 @@ COLORS = {
 }
 
 
+LEVEL_COLORS = {
+    logging.ERROR: COLORS["RED"],
+    logging.WARNING: COLORS["YELLOW"],
+    logging.DEBUG: COLORS["BLUE"],
+}
+
+
 class CustomFormatter(logging.Formatter):
+    def __init__(self, fmt=None, datefmt=None, style="%"):
+        super().__init__(fmt, datefmt, style)
+        # One colored formatter per level, built once instead of for every record
+        self._level_formatters = {level: logging.Formatter(color + self._style._fmt + COLORS["RESET"], datefmt, style) for level, color in LEVEL_COLORS.items()}
+
     def format(self, record):
-        log_fmt = self._style._fmt
-        if record.levelno == logging.ERROR:
-            log_fmt = COLORS["RED"] + log_fmt + COLORS["RESET"]
-        elif record.levelno == logging.WARNING:
-            log_fmt = COLORS["YELLOW"] + log_fmt + COLORS["RESET"]
-        elif record.levelno == logging.DEBUG:
-            log_fmt = COLORS["BLUE"] + log_fmt + COLORS["RESET"]
-        formatter = logging.Formatter(log_fmt, self.datefmt)
+        formatter = self._level_formatters.get(record.levelno)
+        if formatter is None:
+            return super().format(record)
         return formatter.format(record)
 
 
+class DebugSamplingFilter(logging.Filter):
+    """Let at most burst DEBUG records of the same message template through every window seconds.
+
+    The first record of the next window reports how many similar lines were dropped.
+    """
+
+    MAX_TEMPLATES = 1000
+
+    def __init__(self, burst, window):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._windows = {}  # message template -> [window start, records seen]
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG:
+            return True
+
+        entry = self._windows.get(record.msg)
+        if entry is not None and record.created - entry[0] < self.window:
+            entry[1] += 1
+            return entry[1] <= self.burst
+
+        if len(self._windows) >= self.MAX_TEMPLATES:
+            self._windows.clear()
+        self._windows[record.msg] = [record.created, 1]
+        suppressed = entry[1] - self.burst if entry is not None else 0
+        if suppressed > 0:
+            if isinstance(record.args, tuple) and record.args:
+                record.msg = f"{record.msg} (%d similar lines suppressed)"
+                record.args = record.args + (suppressed,)
+            else:
+                # No positional args: the message is not %-formatted, or formatted from a mapping
+                record.msg = f"{record.msg} ({suppressed} similar lines suppressed)"
+        return True
+
+
 class QueueHandler(logging.Handler):
     """Custom logging handler that forwards logs to the message queue."""
     
@@ -115,6 +159,14 @@ def set_logger_level(logger_name, level):
         logging.getLogger(logger_name).error(f"Error while setting logger ${logger_name} level to {logging.getLevelName(logger.level)}: ${str(exc)}")
 
 
+def enable_debug_sampling(burst, window):
+    """Sample repetitive DEBUG lines of the dunebugger logger, burst 0 disables sampling."""
+    for log_filter in [f for f in logger.filters if isinstance(f, DebugSamplingFilter)]:
+        logger.removeFilter(log_filter)
+    if burst > 0:
+        logger.addFilter(DebugSamplingFilter(burst, window))
+
+
 # Global queue handler instance
 _queue_handler = None
 
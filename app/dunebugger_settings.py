@@ -1,6 +1,7 @@
 from os import path
 import configparser
-from dunebugger_logging import logger, get_logging_level_from_name, set_logger_level
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dunebugger_logging import logger, get_logging_level_from_name, set_logger_level, enable_debug_sampling
 from utils import is_raspberry_pi
 
 class DunebuggerSettings:
@@ -12,6 +13,7 @@ class DunebuggerSettings:
         self.load_configuration(self.dunebugger_config)
         self.override_configuration()
         set_logger_level("dunebuggerLog", self.dunebuggerLogLevel)
+        enable_debug_sampling(self.debugSampleBurst, self.debugSampleWindowSecs)
 
     def show_configuration(self):
         print("Current Configuration:")
@@ -25,7 +27,7 @@ class DunebuggerSettings:
 
         try:
             self.config.read(dunebugger_config)
-            for section in ["General", "MessageQueue", "Log"]:
+            for section in ["General", "MessageQueue", "Scheduler", "Monitoring", "Log"]:
                 if not self.config.has_section(section):
                     continue
                 for option in self.config.options(section):
@@ -43,18 +45,95 @@ class DunebuggerSettings:
         # Validation for specific options
         try:
             if section == "General":
-                pass
+                if option in ["eventLoopRuntime"]:
+                    if value not in ["auto", "asyncio", "uvloop"]:
+                        raise ValueError("expected one of auto, asyncio, uvloop")
+                    return value
+                elif option in ["eagerTasks"]:
+                    if value.lower() not in self.config.BOOLEAN_STATES:
+                        raise ValueError("expected a boolean")
+                    return self.config.BOOLEAN_STATES[value.lower()]
             elif section == "MessageQueue":
                 if option in ["mQueueServers", "mQueueClientID", "mQueueSubjectRoot", "mQueueStateCheckIntervalSecs"]:
                     return str(value)
+                elif option in ["mQueueControlLaneSize", "mQueueStateLaneSize", "mQueueLogLaneSize"]:
+                    return int(value)
+                elif option in ["mQueueMaxOccurrencesPerMessage"]:
+                    if int(value) < 1:
+                        raise ValueError("expected a positive integer")
+                    return int(value)
+                elif option in ["mQueueReconnectMinSecs", "mQueueReconnectMaxSecs", "mQueueCoalesceWindowSecs"]:
+                    return float(value)
+            elif section == "Scheduler":
+                if option in ["executionJournalFile", "haLockFile", "scheduleArchiveFile"]:
+                    # Relative paths are resolved against the application folder
+                    return path.join(path.dirname(path.abspath(__file__)), value)
+                elif option in ["scheduleWatchMode"]:
+                    if value not in ["auto", "inotify", "poll", "off"]:
+                        raise ValueError("expected one of auto, inotify, poll, off")
+                    return value
+                elif option in ["scheduleWatchPollSecs", "clockCheckIntervalSecs"]:
+                    return float(value)
+                elif option in ["schedulerTimezone"]:
+                    ZoneInfo(value)  # raises if the timezone is unknown
+                    return value
+                elif option in ["dstSkippedTimePolicy"]:
+                    if value not in ["shift", "skip"]:
+                        raise ValueError("expected one of shift, skip")
+                    return value
+                elif option in ["dstAmbiguousTimePolicy"]:
+                    if value not in ["first", "last"]:
+                        raise ValueError("expected one of first, last")
+                    return value
+                elif option in ["haMode"]:
+                    if value not in ["off", "lockfile", "nats"]:
+                        raise ValueError("expected one of off, lockfile, nats")
+                    return value
+                elif option in ["haLeaseTtlSecs", "haRenewIntervalSecs", "haCatchUpMaxSecs"]:
+                    return float(value)
+                elif option in ["commandAck", "commandDiff"]:
+                    if value.lower() not in self.config.BOOLEAN_STATES:
+                        raise ValueError("expected a boolean")
+                    return self.config.BOOLEAN_STATES[value.lower()]
+                elif option in ["commandAckTimeoutSecs", "commandAckBackoffMaxSecs"]:
+                    return float(value)
+                elif option in ["commandAckRetries", "scheduleCompileProcessThreshold", "scheduleArchiveRetentionDays"]:
+                    return int(value)
+                elif option in ["latitude", "longitude"]:
+                    # Empty when no location is configured, disabling sunrise/sunset entries
+                    if not value:
+                        return None
+                    limit = 90 if option == "latitude" else 180
+                    if not -limit <= float(value) <= limit:
+                        raise ValueError(f"expected a value between -{limit} and {limit}")
+                    return float(value)
+                elif option in ["executionOverlapPolicy"]:
+                    if value not in ["supersede", "queue"]:
+                        raise ValueError("expected one of supersede, queue")
+                    return value
+                elif option in ["unsyncedClockPolicy"]:
+                    if value not in ["flag", "hold"]:
+                        raise ValueError("expected one of flag, hold")
+                    return value
+            elif section == "Monitoring":
+                if option in ["loopMonitorEnabled", "heartbeatReport"]:
+                    if value.lower() not in self.config.BOOLEAN_STATES:
+                        raise ValueError("expected a boolean")
+                    return self.config.BOOLEAN_STATES[value.lower()]
+                elif option in ["loopLagSampleSecs", "loopBlockThresholdSecs"]:
+                    return float(value)
             elif section == "Log":
+                if option in ["debugSampleBurst"]:
+                    return int(value)
+                elif option in ["debugSampleWindowSecs"]:
+                    return float(value)
                 logLevel = get_logging_level_from_name(value)
                 if logLevel == "":
                     return get_logging_level_from_name("INFO")
                 else:
                     return logLevel
 
-        except (configparser.NoOptionError, ValueError) as e:
+        except (configparser.NoOptionError, ValueError, ZoneInfoNotFoundError) as e:
             raise ValueError(f"Invalid configuration: Section={section}, Option={option}, Value={value}. Error: {e}")
 
         # If no specific validation is required, return the original value
@@ -0,0 +1,199 @@
+import os
+import struct
+from datetime import datetime
+from dunebugger_logging import logger
+
+JOURNAL_MAGIC = b"DBJ1"
+HEADER_FORMAT = "<4sHH8x"  # magic, format version, record size, padding
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# planned timestamp, actual timestamp, outcome, flags, commands sent, commands in state, action, commands
+RECORD_FORMAT = "<ddBBHH42s192s"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+COMMAND_SEPARATOR = "\x1f"
+
+OUTCOME_OK = 0
+OUTCOME_PARTIAL = 1
+OUTCOME_FAILED = 2
+OUTCOME_NO_COMMANDS = 3
+OUTCOME_UNACKED = 4  # every command sent, at least one not acknowledged by core
+OUTCOME_SUPERSEDED = 5  # cancelled or dropped because a newer scheduled state fired
+
+# Record flags
+FLAG_CLOCK_UNSYNCED = 0x01  # executed while the system clock was not synchronized
+FLAG_DIFF = 0x02  # only the commands not already applied by the previous state were sent
+
+OUTCOME_NAMES = {
+    OUTCOME_OK: "ok",
+    OUTCOME_PARTIAL: "partial",
+    OUTCOME_FAILED: "failed",
+    OUTCOME_NO_COMMANDS: "no_commands",
+    OUTCOME_UNACKED: "unacked",
+    OUTCOME_SUPERSEDED: "superseded",
+}
+
+
+def _encode_text(text, size):
+    """Encode text into a fixed size field, truncating on a character boundary."""
+    encoded = text.encode("utf-8")
+    if len(encoded) <= size:
+        return encoded
+    return encoded[:size].decode("utf-8", errors="ignore").encode("utf-8")
+
+
+def _decode_text(raw):
+    return raw.rstrip(b"\x00").decode("utf-8", errors="replace")
+
+
+class ExecutionJournal:
+    """Append-only on-disk journal of executed states, made of fixed-size binary records.
+
+    Records are addressed by index, so a single record or a time range can be read
+    with a few seeks instead of loading the whole file.
+    """
+
+    def __init__(self, journal_file):
+        self.journal_file = journal_file
+        self._record_count = 0
+        self._open_journal()
+
+    def _create_journal(self):
+        with open(self.journal_file, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, JOURNAL_MAGIC, 1, RECORD_SIZE))
+        self._record_count = 0
+
+    def _open_journal(self):
+        """Create the journal if missing, otherwise check its header and drop a torn last record.
+
+        A journal in an unknown format is renamed aside and replaced by an empty one,
+        so a corrupt file cannot stop the scheduler from starting.
+        """
+        try:
+            if not os.path.exists(self.journal_file) or os.path.getsize(self.journal_file) == 0:
+                self._create_journal()
+                return
+
+            with open(self.journal_file, "r+b") as f:
+                header = f.read(HEADER_SIZE)
+                valid = len(header) == HEADER_SIZE
+                if valid:
+                    magic, _version, record_size = struct.unpack(HEADER_FORMAT, header)
+                    valid = magic == JOURNAL_MAGIC and record_size == RECORD_SIZE
+                if valid:
+                    data_size = os.path.getsize(self.journal_file) - HEADER_SIZE
+                    self._record_count = data_size // RECORD_SIZE
+                    if data_size % RECORD_SIZE:
+                        logger.warning(f"Discarding incomplete last record in execution journal {self.journal_file}")
+                        f.truncate(HEADER_SIZE + self._record_count * RECORD_SIZE)
+                    return
+
+            corrupt_file = f"{self.journal_file}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            os.replace(self.journal_file, corrupt_file)
+            logger.error(f"Unsupported execution journal format in {self.journal_file}, moved it to {corrupt_file} and started a new journal")
+            self._create_journal()
+        except Exception as e:
+            logger.error(f"Error opening execution journal {self.journal_file}: {e}")
+            raise
+
+    def __len__(self):
+        return self._record_count
+
+    def append(self, planned_time, actual_time, action, commands_sent, commands_total, outcome, flags=0):
+        """Append one execution record and flush it to disk."""
+        planned_ts = planned_time.timestamp() if planned_time else 0.0
+        record = struct.pack(
+            RECORD_FORMAT,
+            planned_ts,
+            actual_time.timestamp(),
+            outcome,
+            flags,
+            len(commands_sent),
+            commands_total,
+            _encode_text(action, 42),
+            _encode_text(COMMAND_SEPARATOR.join(commands_sent), 192),
+        )
+        with open(self.journal_file, "ab") as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        self._record_count += 1
+
+    def _read_raw(self, f, index):
+        f.seek(HEADER_SIZE + index * RECORD_SIZE)
+        return struct.unpack(RECORD_FORMAT, f.read(RECORD_SIZE))
+
+    def _read_timestamp(self, f, index):
+        # The actual execution timestamp is the second field of each record
+        f.seek(HEADER_SIZE + index * RECORD_SIZE + 8)
+        return struct.unpack("<d", f.read(8))[0]
+
+    def _to_dict(self, index, raw):
+        planned_ts, actual_ts, outcome, flags, commands_sent, commands_total, action, commands = raw
+        decoded_commands = _decode_text(commands)
+        return {
+            "index": index,
+            "planned": datetime.fromtimestamp(planned_ts).isoformat() if planned_ts else None,
+            "executed": datetime.fromtimestamp(actual_ts).isoformat(),
+            "lag_ms": round((actual_ts - planned_ts) * 1000) if planned_ts else None,
+            "action": _decode_text(action),
+            "commands": decoded_commands.split(COMMAND_SEPARATOR) if decoded_commands else [],
+            "commands_sent": commands_sent,
+            "commands_total": commands_total,
+            "outcome": OUTCOME_NAMES.get(outcome, str(outcome)),
+            "flags": flags,
+            "clock_unsynced": bool(flags & FLAG_CLOCK_UNSYNCED),
+            "diff": bool(flags & FLAG_DIFF),
+        }
+
+    def read(self, index):
+        """Read a single record by index."""
+        if index < 0 or index >= self._record_count:
+            return None
+        with open(self.journal_file, "rb") as f:
+            return self._to_dict(index, self._read_raw(f, index))
+
+    def last(self):
+        """Return the most recent record, or None if the journal is empty."""
+        return self.read(self._record_count - 1)
+
+    def _lower_bound(self, f, timestamp):
+        """Index of the first record executed at or after timestamp (records are appended in time order)."""
+        low, high = 0, self._record_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._read_timestamp(f, middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start=None, end=None, cursor=None, limit=50):
+        """Return up to limit records executed between start and end (datetimes, inclusive).
+
+        Pass the returned next_cursor back as cursor to fetch the following page.
+        """
+        records = []
+        next_cursor = None
+        if self._record_count == 0:
+            return {"records": records, "next_cursor": next_cursor, "total": 0}
+
+        end_ts = end.timestamp() if end else None
+        with open(self.journal_file, "rb") as f:
+            if cursor is not None:
+                index = max(0, int(cursor))
+            elif start is not None:
+                index = self._lower_bound(f, start.timestamp())
+            else:
+                index = 0
+
+            while index < self._record_count:
+                raw = self._read_raw(f, index)
+                if end_ts is not None and raw[1] > end_ts:
+                    break
+                if len(records) >= limit:
+                    next_cursor = index
+                    break
+                records.append(self._to_dict(index, raw))
+                index += 1
+
+        return {"records": records, "next_cursor": next_cursor, "total": self._record_count}
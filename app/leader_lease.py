@@ -0,0 +1,278 @@
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import time
+from nats.errors import (
+    ConnectionClosedError,
+    ConnectionDrainingError,
+    ConnectionReconnectingError,
+    NoRespondersError,
+    StaleConnectionError,
+)
+from nats.js.errors import BucketNotFoundError, KeyWrongLastSequenceError, NotFoundError
+from dunebugger_logging import logger
+
+
+# Errors after which the cached key-value handle may be bound to a dead client
+CONNECTION_ERRORS = (
+    ConnectionClosedError,
+    ConnectionDrainingError,
+    ConnectionReconnectingError,
+    NoRespondersError,
+    StaleConnectionError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+
+def default_replica_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LockFileLease:
+    """Lease held through an exclusive flock on a local file, for replicas sharing a host or volume.
+
+    The kernel drops the lock when the holder dies, so a standby takes over on its next attempt.
+    The lease state (holder and last planned execution) is stored in the lock file itself.
+
+    Lease backends: acquire() returns whether the lease was taken, renew() returns False
+    once the lease is lost for sure and raises when it cannot tell.
+    """
+
+    def __init__(self, lock_file, replica_id):
+        self.lock_file = lock_file
+        self.replica_id = replica_id
+        self._fd = None
+
+    async def acquire(self):
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    async def renew(self):
+        return self._fd is not None
+
+    async def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    async def read_state(self):
+        try:
+            with open(self.lock_file, "rb") as f:
+                content = f.read()
+            return json.loads(content) if content else {}
+        except (OSError, ValueError):
+            return {}
+
+    async def write_state(self, state):
+        if self._fd is None:
+            return
+        content = json.dumps(dict(state, holder=self.replica_id)).encode()
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, content, 0)
+        os.fsync(self._fd)
+
+
+class NatsKvLease:
+    """Lease held as a key of a NATS JetStream key-value bucket.
+
+    The holder rewrites the key every renewal with a compare-and-set on its revision.
+    A standby takes the key over, with the same compare-and-set, once it has seen the
+    same revision for ttl seconds of its own monotonic clock, so clock skew between
+    replicas does not matter. The key never expires, which keeps the lease state.
+    """
+
+    def __init__(self, mqueue, bucket, key, ttl, replica_id):
+        self.mqueue = mqueue
+        self.bucket = bucket
+        self.key = key
+        self.ttl = ttl
+        self.replica_id = replica_id
+        self._kv = None
+        self._kv_client = None  # NATS client the cached handle was built from
+        self._revision = None  # revision written by us while holding the lease
+        self._seen_revision = None
+        self._seen_at = None
+        self._state = {}
+
+    async def _get_kv(self):
+        # NATSComm replaces its client on every reconnect, a handle from the old one is dead
+        if self._kv is None or self._kv_client is not self.mqueue.nc:
+            nc = self.mqueue.nc
+            js = nc.jetstream()
+            try:
+                self._kv = await js.key_value(self.bucket)
+            except BucketNotFoundError:
+                self._kv = await js.create_key_value(bucket=self.bucket, history=1)
+            self._kv_client = nc
+        return self._kv
+
+    def _drop_kv(self):
+        self._kv = None
+        self._kv_client = None
+
+    def _value(self, released=False):
+        return json.dumps(dict(self._state, holder=self.replica_id, released=released)).encode()
+
+    async def _get_entry(self, kv):
+        try:
+            return await kv.get(self.key)
+        except NotFoundError:
+            return None
+
+    async def acquire(self):
+        if not self.mqueue.is_connected:
+            return False
+        try:
+            kv = await self._get_kv()
+            entry = await self._get_entry(kv)
+            if entry is None:
+                self._state = {}
+                self._revision = await kv.create(self.key, self._value())
+                return True
+
+            current = json.loads(entry.value) if entry.value else {}
+            self._state = {"last_planned": current.get("last_planned"), "holder": current.get("holder")}
+            if not current.get("released"):
+                # The holder is alive as long as the revision keeps changing
+                now = time.monotonic()
+                if entry.revision != self._seen_revision:
+                    self._seen_revision, self._seen_at = entry.revision, now
+                    return False
+                if now - self._seen_at < self.ttl:
+                    return False
+            self._revision = await kv.update(self.key, self._value(), last=entry.revision)
+            return True
+        except KeyWrongLastSequenceError:
+            # Another replica got there first
+            return False
+        except CONNECTION_ERRORS:
+            self._drop_kv()
+            raise
+
+    async def renew(self):
+        if self._revision is None:
+            return False
+        if not self.mqueue.is_connected:
+            raise ConnectionError("not connected to NATS")
+        try:
+            self._revision = await (await self._get_kv()).update(self.key, self._value(), last=self._revision)
+            return True
+        except KeyWrongLastSequenceError:
+            # Another replica took the key over
+            self._revision = None
+            return False
+        except CONNECTION_ERRORS:
+            self._drop_kv()
+            raise
+
+    async def release(self):
+        """Mark the lease released, so a standby takes over without waiting for ttl."""
+        if self._revision is None or not self.mqueue.is_connected:
+            return
+        try:
+            await (await self._get_kv()).update(self.key, self._value(released=True), last=self._revision)
+        except Exception as e:
+            if isinstance(e, CONNECTION_ERRORS):
+                self._drop_kv()
+            logger.debug(f"Unable to release lease key {self.key}: {e}")
+        self._revision = None
+
+    async def read_state(self):
+        return dict(self._state)
+
+    async def write_state(self, state):
+        self._state.update(state)
+        await self.renew()
+
+
+class LeaderElection:
+    """Keep trying to hold the lease; only the holder may dispatch scheduled actions.
+
+    The lease also carries the planned time of the last executed action, so a replica
+    taking over knows which actions the previous leader already ran.
+    """
+
+    def __init__(self, lease, ttl=6, renew_interval=2):
+        self.lease = lease
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.is_leader = False
+        self.last_planned_ts = None
+        self.leader_since = None
+        self._leadership = asyncio.Event()
+        self._last_renewal = None
+        self.election_task = None
+
+    async def start(self):
+        """Start the election task"""
+        self.election_task = asyncio.create_task(self._election_loop())
+
+    async def stop(self):
+        """Stop the election task and hand the lease over"""
+        if self.election_task:
+            self.election_task.cancel()
+            try:
+                await self.election_task
+            except asyncio.CancelledError:
+                pass
+        if self.is_leader:
+            self._step_down("shutting down")
+            await self.lease.release()
+
+    async def wait_for_leadership(self):
+        await self._leadership.wait()
+
+    def _step_down(self, reason):
+        logger.warning(f"Scheduler leadership lost: {reason}")
+        self.is_leader = False
+        self.leader_since = None
+        self._leadership.clear()
+
+    async def _election_loop(self):
+        while True:
+            try:
+                if self.is_leader:
+                    if await self.lease.renew():
+                        self._last_renewal = time.monotonic()
+                    else:
+                        self._step_down("lease taken over by another replica")
+                elif await self.lease.acquire():
+                    state = await self.lease.read_state()
+                    self.last_planned_ts = state.get("last_planned")
+                    self._last_renewal = time.monotonic()
+                    self.is_leader = True
+                    self.leader_since = time.time()
+                    self._leadership.set()
+                    logger.info(f"Acquired scheduler leadership (previous holder: {state.get('holder')})")
+            except Exception as e:
+                logger.error(f"Error in leader election: {e}")
+                if self.is_leader and time.monotonic() - self._last_renewal > self.ttl - self.renew_interval:
+                    self._step_down(str(e))
+            await asyncio.sleep(self.renew_interval)
+
+    async def record_execution(self, planned_time):
+        """Store the planned time of an executed action in the lease."""
+        self.last_planned_ts = planned_time.timestamp()
+        if self.is_leader:
+            try:
+                await self.lease.write_state({"last_planned": self.last_planned_ts})
+            except Exception as e:
+                logger.error(f"Failed to record execution in the lease: {e}")
+
+    def get_status(self):
+        return {
+            "replica_id": self.lease.replica_id,
+            "leader": self.is_leader,
+            "leader_since": self.leader_since,
+            "last_planned_ts": self.last_planned_ts,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from dunebugger_logging import logger
+
+
+class LoopMonitor:
+    """Measure how late the event loop wakes up, and catch the calls that block it.
+
+    A task sleeps for sample_interval and records how much later than requested it woke up.
+    A watchdog thread checks that the task keeps ticking: when the loop has not run for
+    block_threshold seconds, the stack of the loop thread is captured, which shows the
+    blocking call while it is still running.
+    """
+
+    def __init__(self, sample_interval=0.25, block_threshold=0.5, max_samples=1200, max_blocked_events=20):
+        self.sample_interval = sample_interval
+        self.block_threshold = block_threshold
+        self.lags = deque(maxlen=max_samples)  # seconds, most recent samples
+        self.max_lag = 0.0
+        self.blocked_events = deque(maxlen=max_blocked_events)
+        self.blocked_count = 0
+        self.monitor_task = None
+        self._watchdog = None
+        self._stop_watchdog = threading.Event()
+        self._loop_thread_id = None
+        self._last_tick = None
+
+    async def start_monitoring(self):
+        """Start the lag sampler task and the blocking-call watchdog thread"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self.monitor_task = asyncio.create_task(self._sample_lag())
+        self._stop_watchdog.clear()
+        self._watchdog = threading.Thread(target=self._watch_loop, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop_monitoring(self):
+        """Stop the sampler task and the watchdog thread"""
+        self._stop_watchdog.set()
+        if self.monitor_task:
+            self.monitor_task.cancel()
+            try:
+                await self.monitor_task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+
+    async def _sample_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.sample_interval)
+            self._last_tick = time.monotonic()
+            lag = max(0.0, self._last_tick - started - self.sample_interval)
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def _watch_loop(self):
+        reported_tick = None
+        while not self._stop_watchdog.wait(self.block_threshold / 2):
+            last_tick = self._last_tick
+            blocked_for = time.monotonic() - last_tick - self.sample_interval
+            # Report each stall once, when it crosses the threshold
+            if blocked_for < self.block_threshold or last_tick == reported_tick:
+                continue
+            reported_tick = last_tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = traceback.format_stack(frame) if frame else []
+            self.blocked_count += 1
+            self.blocked_events.append({"at": datetime.now().isoformat(), "blocked_secs": round(blocked_for, 3), "stack": stack})
+            logger.warning(f"Event loop blocked for more than {blocked_for:.2f}s in:\n{''.join(stack[-4:])}")
+
+    def _percentile(self, samples, percentile):
+        return samples[min(len(samples) - 1, int(len(samples) * percentile))]
+
+    def get_stats(self):
+        """Return loop lag statistics in milliseconds and the most recent blocking stall."""
+        samples = sorted(self.lags)
+        if not samples:
+            return {"samples": 0, "blocked_count": self.blocked_count}
+        return {
+            "samples": len(samples),
+            "max_ms": round(self.max_lag * 1000, 3),
+            "p50_ms": round(self._percentile(samples, 0.50) * 1000, 3),
+            "p95_ms": round(self._percentile(samples, 0.95) * 1000, 3),
+            "p99_ms": round(self._percentile(samples, 0.99) * 1000, 3),
+            "blocked_count": self.blocked_count,
+            "last_blocked": self.blocked_events[-1] if self.blocked_events else None,
+        }
@@ -1,24 +1,41 @@
 #!/usr/bin/env python3
+import argparse
 import asyncio
-from class_factory import mqueue, schedule_interpreter, state_tracker
-from dunebugger_logging import logger
+import json
 
 async def main():
     try:
+        # Sample event loop lag and catch blocking calls from the start
+        if settings.loopMonitorEnabled:
+            await loop_monitor.start_monitoring()
+
         await mqueue.start_listener()
         # wait that NATS is connected before continuing
         while not mqueue.is_connected:
             await asyncio.sleep(1)
         
+        # Compete for the scheduler lease, standbys keep everything loaded but do not dispatch
+        if leader_election:
+            await leader_election.start()
+
         # Wait a bit for lists to be received
         await asyncio.sleep(2)
         
         # Start the state monitoring task
         await state_tracker.start_state_monitoring()
 
+        # Keep track of the system clock synchronisation in the background
+        await clock_monitor.start_monitoring()
+
         # Initialize schedule after validation
         await schedule_interpreter.init_schedule()
 
+        # Hot-reload schedule.conf when it is edited outside the scheduler
+        await schedule_watcher.start()
+
+        # Archive expired special dates now and then daily
+        await schedule_compactor.start()
+
         # Start the scheduler service
         scheduler_task = asyncio.create_task(schedule_interpreter.run_scheduler())
         
@@ -44,10 +61,32 @@ async def main():
             except asyncio.CancelledError:
                 logger.info("Scheduler task cancelled successfully")
         
+        await schedule_watcher.stop()
+        await schedule_compactor.stop()
+        await clock_monitor.stop_monitoring()
+        await loop_monitor.stop_monitoring()
+        schedule_interpreter.shutdown_compiler()
+        if leader_election:
+            await leader_election.stop()
+
         # Close NATS connection
         await mqueue.close_listener()
  
         logger.info("Cleanup completed.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Imported here, not at module level: schedule compiler workers re-import this script as
+    # __mp_main__, and must not build a second set of settings, NATS client and journal
+    import runtime
+    from class_factory import mqueue, schedule_interpreter, state_tracker, schedule_watcher, schedule_compactor, clock_monitor, loop_monitor, leader_election
+    from dunebugger_settings import settings
+    from dunebugger_logging import logger
+
+    parser = argparse.ArgumentParser(description="dunebugger scheduler")
+    parser.add_argument("--benchmark", action="store_true", help="Compare message throughput and timer lag of the available event loop runtimes, then exit")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(json.dumps(runtime.run_benchmark(), indent=2))
+    else:
+        runtime.run(main, settings.eventLoopRuntime, settings.eagerTasks)
@@ -1,11 +1,108 @@
 from nats.aio.client import Client as NATS
+from nats.errors import ConnectionClosedError, ConnectionDrainingError, ConnectionReconnectingError, FlushTimeoutError, NoServersError, OutboundBufferLimitError, StaleConnectionError
 import json
 import asyncio
+import random
+import time
+from collections import deque
 from dunebugger_logging import logger
 
+# Outbound lanes in priority order: the writer always publishes from the first non empty lane,
+# so commands to core never wait behind state replies or log chatter
+OUTBOUND_LANES = ("control", "state", "log")
+OUTBOUND_LANE_BY_SUBJECT = {
+    "dunebugger_set": "control",
+    "schedule_command": "control",
+    "log": "log",
+    "log_message": "log",
+}
+DEFAULT_OUTBOUND_LANE = "state"
+
+# Publish errors worth retrying once the connection is back, any other error would fail again
+RETRYABLE_PUBLISH_ERRORS = (
+    ConnectionClosedError,
+    ConnectionDrainingError,
+    ConnectionReconnectingError,
+    FlushTimeoutError,
+    NoServersError,
+    OutboundBufferLimitError,
+    StaleConnectionError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+# How a full lane makes room, per subject:
+#   drop_oldest - evict the oldest queued message of the lane
+#   drop_newest - discard the incoming message
+#   replace     - keep only the latest message for the same recipient and subject
+OUTBOUND_DROP_POLICIES = {
+    "dunebugger_set": "drop_oldest",
+    "schedule_command": "drop_oldest",
+    "current_schedule": "replace",
+    "next_actions": "replace",
+    "last_executed_action": "replace",
+    "heartbeat": "replace",
+    "log": "drop_newest",
+    "log_message": "drop_newest",
+}
+DEFAULT_DROP_POLICY = "drop_oldest"
+LATENCY_SAMPLES = 256
+
+
+class OutboundLane:
+    """Bounded queue of encoded messages waiting to be published, with latency statistics."""
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.queue = deque()  # (enqueued at, recipient, subject, payload, reply subject)
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0  # dropped because publishing them can never succeed
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # enqueue to publish, in seconds
+        self.max_latency = 0.0
+
+    def push(self, recipient, subject, payload, reply_subject):
+        """Queue a message according to the subject drop policy, return False if it was dropped."""
+        # No logging in here: a log_message that logs while being queued would feed itself
+        policy = OUTBOUND_DROP_POLICIES.get(subject, DEFAULT_DROP_POLICY)
+        if policy == "replace":
+            for index, queued in enumerate(self.queue):
+                if queued[1] == recipient and queued[2] == subject:
+                    del self.queue[index]
+                    break
+
+        if len(self.queue) >= self.capacity:
+            self.dropped += 1
+            if policy == "drop_newest":
+                return False
+            self.queue.popleft()
+
+        self.queue.append((time.monotonic(), recipient, subject, payload, reply_subject))
+        return True
+
+    def record_sent(self, enqueued_at):
+        latency = time.monotonic() - enqueued_at
+        self.sent += 1
+        self.latencies.append(latency)
+        self.max_latency = max(self.max_latency, latency)
+
+    def get_stats(self):
+        samples = sorted(self.latencies)
+        return {
+            "depth": len(self.queue),
+            "capacity": self.capacity,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "latency_avg_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else None,
+            "latency_p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3) if samples else None,
+            "latency_max_ms": round(self.max_latency * 1000, 3),
+        }
+
 
 class NATSComm:
-    def __init__(self, nat_servers, client_id, subject_root, mqueue_handler):
+    def __init__(self, nat_servers, client_id, subject_root, mqueue_handler, lane_sizes=None, reconnect_min_secs=0.5, reconnect_max_secs=30):
         self.nc = NATS()
         self.servers = nat_servers
         self.client_id = client_id
@@ -13,58 +110,78 @@ class NATSComm:
         self.mqueue_handler = mqueue_handler
         self.is_connected = False
         self.connection_task = None
-        self.retry_interval = 10  # seconds between connection attempts
+        self.reconnect_min_secs = reconnect_min_secs  # first retry delay after a failure
+        self.reconnect_max_secs = reconnect_max_secs  # upper bound of the exponential backoff
+        self._reconnect_attempt = 0
+        self._disconnected = asyncio.Event()
 
-        self.nc.on_connect = lambda nc: logger.info(f"Connected to NATS messaging server: {self.servers}")
+        # Every outbound message goes through a priority lane, drained by a single writer task
+        lane_sizes = lane_sizes or {}
+        self.lanes = {name: OutboundLane(name, lane_sizes.get(name, 200)) for name in OUTBOUND_LANES}
+        self._outbound_ready = asyncio.Event()
+        self.writer_task = None
 
     async def disconnected_cb(self):
         self.is_connected = False
         logger.warning("Disconnected from NATS messaging server")
 
-    async def reconnected_cb(self):
-        self.is_connected = True
-        logger.info(f"Got reconnected to {self.nc.connected_url.netloc}")
+    async def closed_cb(self):
+        # Reconnection is handled by _connection_loop (backoff with jitter), not by the client
+        self.is_connected = False
+        self._disconnected.set()
 
     async def error_cb(self, error):
-        logger.error(f"Error occurred: {error}")
+        logger.error("Error occurred: %s", error)
 
     async def close_listener(self):
         """Async method to properly close NATS connection"""
         try:
-            # Stop the connection task if it's running
-            if self.connection_task and not self.connection_task.done():
-                self.connection_task.cancel()
-                try:
-                    await self.connection_task
-                except asyncio.CancelledError:
-                    pass
+            # Stop the connection and writer tasks if they are running
+            for task in (self.connection_task, self.writer_task):
+                if task and not task.done():
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
             
             if self.nc.is_connected:
                 await self.nc.drain()
                 logger.debug("NATS connection closed")
         except Exception as e:
-            logger.error(f"Error closing NATS connection: {e}")
+            logger.error("Error closing NATS connection: %s", e)
 
     async def connect(self):
         try:
+            # A closed client cannot be reused, start every attempt from a fresh one
+            self.nc = NATS()
             await self.nc.connect(
                 servers=self.servers,
                 name=self.client_id,
                 ping_interval=5,
                 max_outstanding_pings=3,
-                reconnect_time_wait=10,
-                reconnected_cb=self.reconnected_cb,
+                allow_reconnect=False,
+                # Let a single connect() call give up quickly, the backoff lives in _connection_loop
+                max_reconnect_attempts=1,
+                reconnect_time_wait=self.reconnect_min_secs,
                 disconnected_cb=self.disconnected_cb,
+                closed_cb=self.closed_cb,
                 error_cb=self.error_cb,
-                max_reconnect_attempts=-1,  # Unlimited reconnect attempts
             )
             self.is_connected = True
+            self._disconnected.clear()
             return True
         except Exception as e:
             self.is_connected = False
-            logger.debug(f"Failed to connect to NATS: {e}")
+            logger.debug("Failed to connect to NATS: %s", e)
             return False
 
+    def _next_reconnect_delay(self):
+        """Exponential backoff with jitter, so a fleet of clients does not reconnect in lockstep."""
+        ceiling = min(self.reconnect_max_secs, self.reconnect_min_secs * (2 ** (self._reconnect_attempt + 1)))
+        self._reconnect_attempt += 1
+        return random.uniform(self.reconnect_min_secs, ceiling)
+
     async def _connection_loop(self):
         """Background task that continuously tries to establish NATS connection"""
         while True:
@@ -73,27 +190,35 @@ class NATSComm:
                     logger.debug("Attempting to connect to NATS messaging server...")
                     success = await self.connect()
                     if success:
-                        logger.info(f"Connected to NATS messaging server: {self.servers}")
+                        logger.info("Connected to NATS messaging server: %s", self.servers)
                         # Subscribe to messages once connected
                         try:
                             await self.nc.subscribe(f"{self.subject_root}.{self.client_id}.*", cb=self._handler)
                             await self.nc.flush()
-                            logger.info(f"Listening for messages on queue {self.subject_root}.{self.client_id}.")
+                            logger.info("Listening for messages on queue %s.%s.", self.subject_root, self.client_id)
+                            self._reconnect_attempt = 0
+                            # Let the writer publish what was queued while disconnected
+                            self._outbound_ready.set()
                         except Exception as e:
-                            logger.error(f"Failed to subscribe to messaging queue: {e}")
+                            logger.error("Failed to subscribe to messaging queue: %s", e)
                             self.is_connected = False
-                    else:
-                        logger.debug(f"Connection failed, retrying in {self.retry_interval} seconds...")
-                        
-                # Wait before next connection attempt or status check
-                await asyncio.sleep(self.retry_interval)
-                
+                            await self.nc.close()
+
+                    if not self.is_connected:
+                        retry_delay = self._next_reconnect_delay()
+                        logger.debug("Connection failed, retrying in %.1f seconds...", retry_delay)
+                        await asyncio.sleep(retry_delay)
+                        continue
+
+                # Wait until the connection is lost before trying again
+                await self._disconnected.wait()
+
             except asyncio.CancelledError:
                 logger.debug("Connection loop cancelled")
                 break
             except Exception as e:
-                logger.error(f"Unexpected error in connection loop: {e}")
-                await asyncio.sleep(self.retry_interval)
+                logger.error("Unexpected error in connection loop: %s", e)
+                await asyncio.sleep(self._next_reconnect_delay())
 
     async def _handler(self, mqueue_message):
         try:
@@ -102,34 +227,111 @@ class NATSComm:
                 if isinstance(command_reply_message, dict) and "message" in command_reply_message:
                     logger.debug(command_reply_message["message"])
                 else:
-                    logger.debug(f"Received reply: {command_reply_message}")
+                    logger.debug("Received reply: %s", command_reply_message)
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
+            logger.error("Error processing message: %s", e)
 
     async def start_listener(self):
         """Start the non-blocking NATS connection process"""
         logger.info("Starting NATS connection manager (non-blocking)")
         self.connection_task = asyncio.create_task(self._connection_loop())
+        self.writer_task = asyncio.create_task(self._writer_loop())
         return self.connection_task
 
     def get_connection_status(self):
         """Return current connection status"""
         return self.is_connected
 
-    async def send(self, message: dict, recipient, reply_subject=None):
+    def get_pending_bytes(self):
+        """Return the bytes written to the NATS client but not flushed to the server yet."""
+        return self.nc.pending_data_size if self.is_connected else 0
+
+    def get_outbound_queue_depth(self):
+        """Return the number of messages waiting to be published, over all lanes."""
+        return sum(len(lane.queue) for lane in self.lanes.values())
+
+    def get_lane_stats(self):
+        """Return depth, drops and publish latency of each outbound lane."""
+        return {name: lane.get_stats() for name, lane in self.lanes.items()}
+
+    def get_outbound_status(self):
+        """Return connection and outbound lanes statistics for monitoring."""
+        return {
+            "connected": self.is_connected,
+            "queue_depth": self.get_outbound_queue_depth(),
+            "dropped": sum(lane.dropped for lane in self.lanes.values()),
+            "failed": sum(lane.failed for lane in self.lanes.values()),
+            "reconnect_attempt": self._reconnect_attempt,
+            "lanes": self.get_lane_stats(),
+        }
+
+    async def _publish(self, recipient, subject, payload, reply_subject=None):
+        if reply_subject:
+            await self.nc.publish(f"{self.subject_root}.{recipient}.{subject}", payload, reply=reply_subject)
+        else:
+            await self.nc.publish(f"{self.subject_root}.{recipient}.{subject}", payload)
+
+    def _next_lane(self):
+        for lane in self.lanes.values():
+            if lane.queue:
+                return lane
+        return None
+
+    async def _writer_loop(self):
+        """Publish queued messages while connected, always from the highest priority lane first."""
+        while True:
+            await self._outbound_ready.wait()
+            self._outbound_ready.clear()
+
+            while self.is_connected:
+                lane = self._next_lane()
+                if lane is None:
+                    break
+                enqueued_at, recipient, subject, payload, reply_subject = lane.queue[0]
+                try:
+                    await self._publish(recipient, subject, payload, reply_subject)
+                except asyncio.CancelledError:
+                    raise
+                except RETRYABLE_PUBLISH_ERRORS as e:
+                    # Keep the message at the head of its lane, retried on the next send or reconnect
+                    logger.error("Error publishing %s message: %s", subject, e)
+                    break
+                except Exception as e:
+                    # e.g. payload too large or invalid subject, keeping it would block the lane forever
+                    lane.queue.popleft()
+                    lane.failed += 1
+                    logger.error("Dropping %s message that cannot be published: %s", subject, str(e) or type(e).__name__)
+                    continue
+                lane.queue.popleft()
+                lane.record_sent(enqueued_at)
+                # Give producers a chance to queue higher priority messages between publishes
+                await asyncio.sleep(0)
+
+    async def request(self, message: dict, recipient, timeout):
+        """Publish a message and wait for its reply, bypassing the lanes.
+
+        Returns the decoded reply, raises if NATS is unavailable or no reply comes within timeout.
+        """
         if not self.is_connected:
-            logger.warning("NATS not connected, cannot send message")
-            return False
-            
+            raise ConnectionError("not connected to NATS")
+        reply = await self.nc.request(f"{self.subject_root}.{recipient}.{message['subject']}", json.dumps(message).encode(), timeout=timeout)
+        return json.loads(reply.data) if reply.data else None
+
+    async def send(self, message: dict, recipient, reply_subject=None):
+        """Queue a message on its priority lane for publishing.
+
+        Messages are kept while NATS is unavailable and published on reconnect.
+        Returns True if the message was queued, False if it was dropped.
+        """
         try:
             # Convert dictionary to JSON string, then encode to bytes
             subject = message["subject"]
-            message_json = json.dumps(message)
-            if reply_subject:
-                await self.nc.publish(f"{self.subject_root}.{recipient}.{subject}", message_json.encode(), reply_to=reply_subject)
-            else:
-                await self.nc.publish(f"{self.subject_root}.{recipient}.{subject}", message_json.encode())
-            return True
+            payload = json.dumps(message).encode()
         except Exception as e:
-            logger.error(f"Error sending message: {e}")
+            logger.error("Error sending message: %s", e)
             return False
+
+        lane = self.lanes[OUTBOUND_LANE_BY_SUBJECT.get(subject, DEFAULT_OUTBOUND_LANE)]
+        queued = lane.push(recipient, subject, payload, reply_subject)
+        self._outbound_ready.set()
+        return queued
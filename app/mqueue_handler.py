@@ -1,70 +1,246 @@
 import json
+import asyncio
+import time
+from functools import partial
+from datetime import datetime, date
 from dunebugger_logging import logger
 from dunebugger_settings import settings
 
+class Route:
+    """A subject handled by MessagingQueueHandler.
+
+    needs_body tells whether the payload must be decoded at all; handlers of body-less
+    routes are called without arguments. schema optionally checks the body: either a
+    type (or tuple of types) for the whole body, or a dict of required key -> type.
+    """
+
+    def __init__(self, subject, handler, needs_body=False, schema=None):
+        self.subject = subject
+        self.handler = handler
+        self.needs_body = needs_body
+        self.schema = schema
+
+
+def _check_schema(body, schema):
+    """Return why body does not match schema, or None if it does."""
+    if schema is None:
+        return None
+    if isinstance(schema, dict):
+        if not isinstance(body, dict):
+            return f"body must be an object, got {type(body).__name__}"
+        for key, expected_type in schema.items():
+            if key not in body:
+                return f"missing field '{key}'"
+            if not isinstance(body[key], expected_type):
+                return f"field '{key}' must be {getattr(expected_type, '__name__', expected_type)}"
+        return None
+    if not isinstance(body, schema):
+        return f"body must be {getattr(schema, '__name__', schema)}, got {type(body).__name__}"
+    return None
+
+
 class MessagingQueueHandler:
     """Class to handle messaging queue operations."""
 
-    def __init__(self):
+    def __init__(self, coalesce_window=1.0, heartbeat_report=False):
         self.mqueue_sender = None
         self.schedule_interpreter = None
+        # With heartbeat_report the heartbeat reply carries the report of every health provider
+        self.heartbeat_report = heartbeat_report
+        self.health_providers = {}
+        # Single-flight coalescing of identical get_*/refresh requests
+        self.coalesce_window = coalesce_window
+        self._inflight = {}  # (subject, state version) -> running task
+        self._recently_done = {}  # (subject, state version) -> loop time of completion
+        self.coalesced_counts = {}
+        self.executed_counts = {}
+
+        self.routes = {}
+        # Middlewares wrap every routed call: async middleware(route, message_json, call_next)
+        self.middlewares = []
+        self.route_stats = {}  # subject -> {"calls", "errors", "total_ms", "max_ms"}
+        self._register_default_routes()
+        self.add_middleware(self._timing_middleware)
+
+    def _register_default_routes(self):
+        self.register_route("refresh", self.handle_refresh)
+        self.register_route("heartbeat", self.handle_heartbeat)
+        self.register_route("commands_list", self.handle_commands_list, needs_body=True)
+        self.register_route("states_list", self.handle_states_list, needs_body=True, schema=(dict, list))
+        self.register_route("update_schedule", self.handle_update_schedule, needs_body=True, schema=str)
+        self.register_route("validate_schedule", self.handle_validate_schedule, needs_body=True, schema=str)
+        self.register_route("get_schedule", self.handle_get_schedule, needs_body=True)
+        self.register_route("get_next_actions", self.handle_get_next_actions)
+        self.register_route("get_last_executed_action", self.handle_get_last_executed_action)
+        self.register_route("get_occurrences", self.handle_get_occurrences, needs_body=True, schema={"from": str, "to": str})
+        self.register_route("get_execution_history", self.handle_get_execution_history, needs_body=True)
+        self.register_route("full_resync", self.handle_full_resync)
+
+    def register_route(self, subject, handler, needs_body=False, schema=None):
+        """Route messages of subject to handler, replacing any previous route for it."""
+        self.routes[subject] = Route(subject, handler, needs_body, schema)
+
+    def register_health_provider(self, name, provider):
+        """Add provider() output under name in the heartbeat report."""
+        self.health_providers[name] = provider
+
+    def get_health_report(self):
+        report = {"status": "alive"}
+        for name, provider in self.health_providers.items():
+            try:
+                report[name] = provider()
+            except Exception as e:
+                report[name] = {"error": str(e)}
+        return report
+
+    def add_middleware(self, middleware):
+        """Add a middleware, the first added is the outermost."""
+        self.middlewares.append(middleware)
+
+    async def _timing_middleware(self, route, message_json, call_next):
+        started = time.perf_counter()
+        stats = self.route_stats.setdefault(route.subject, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        try:
+            return await call_next()
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def get_route_stats(self):
+        """Return call counts and handler durations per subject."""
+        return {
+            subject: {"calls": stats["calls"], "errors": stats["errors"], "avg_ms": round(stats["total_ms"] / stats["calls"], 3) if stats["calls"] else None, "max_ms": round(stats["max_ms"], 3)}
+            for subject, stats in self.route_stats.items()
+        }
+
+    async def _call_route(self, route, message_json):
+        async def call_handler():
+            if route.needs_body:
+                return await route.handler(message_json)
+            return await route.handler()
+
+        call_next = call_handler
+        for middleware in reversed(self.middlewares):
+            call_next = partial(middleware, route, message_json, call_next)
+        return await call_next()
 
     async def process_mqueue_message(self, mqueue_message):
         """Callback method to process received messages."""
-        # Parse the JSON string back into a dictionary
         try:
-            data = mqueue_message.data.decode()
-            message_json = json.loads(data)
-        except (AttributeError, UnicodeDecodeError) as decode_error:
-            logger.error(f"Failed to decode message data: {decode_error}. Raw message: {mqueue_message.data}")
+            subject = (mqueue_message.subject).split(".")[2]
+        except (AttributeError, IndexError):
+            logger.error("Invalid message subject: %s", getattr(mqueue_message, 'subject', None))
             return
-        except json.JSONDecodeError as json_error:
-            logger.error(f"Failed to parse message as JSON: {json_error}. Raw message: {data}")
+
+        route = self.routes.get(subject)
+        if route is None:
+            logger.warning("Unknown subject: %s. Ignoring message.", subject)
             return
 
+        # Only decode the payload of routes that use it
+        message_json = None
+        if route.needs_body:
+            try:
+                data = mqueue_message.data.decode()
+                message_json = json.loads(data)
+            except (AttributeError, UnicodeDecodeError) as decode_error:
+                logger.error("Failed to decode message data: %s. Raw message: %s", decode_error, mqueue_message.data)
+                return
+            except json.JSONDecodeError as json_error:
+                logger.error("Failed to parse message as JSON: %s. Raw message: %s", json_error, data)
+                return
+
+            schema_error = _check_schema(message_json.get("body") if isinstance(message_json, dict) else None, route.schema)
+            if schema_error:
+                logger.error("Invalid %s message: %s", subject, schema_error)
+                return
+
         try:
-            subject = (mqueue_message.subject).split(".")[2]
-            #TODO: too much verbosity
-            logger.debug(f"Processing message: {str(message_json)[:20]}. Subject: {subject}. Reply to: {mqueue_message.reply}")
-
-            if subject in ["refresh"]:
-                await self.handle_refresh()
-            elif subject in ["heartbeat"]:
-                await self.handle_heartbeat()
-            elif subject in ["commands_list"]:
-                await self.handle_commands_list(message_json)
-            elif subject in ["states_list"]:
-                await self.handle_states_list(message_json)
-            elif subject in ["update_schedule"]:
-                return await self.handle_update_schedule(message_json)
-            elif subject in ["get_schedule"]:
-                await self.handle_get_schedule()
-            elif subject in ["get_next_actions"]:
-                await self.handle_get_next_actions()
-            elif subject in ["get_last_executed_action"]:
-                await self.handle_get_last_executed_action()
-            else:
-                logger.warning(f"Unknown subject: {subject}. Ignoring message.")
+            # Lazy formatting: the message is only stringified when the line is emitted
+            logger.debug("Processing message: %.20s. Subject: %s. Reply to: %s", message_json, subject, mqueue_message.reply)
+            return await self._call_route(route, message_json)
         except KeyError as key_error:
-            logger.error(f"KeyError: {key_error}. Message: {message_json}")
+            logger.error("KeyError: %s. Message: %s", key_error, message_json)
         except Exception as e:
-            logger.error(f"Error processing message: {e}. Message: {message_json}")
+            logger.error("Error processing message: %s. Message: %s", e, message_json)
 
-    async def dispatch_message(self, message_body, subject, recipient, reply_subject=None):
+    def _build_message(self, message_body, subject, message_id=None, dedup_key=None):
         message = {
             "body": message_body,
             "subject": subject,
             "source": settings.mQueueClientID,
         }
+        if message_id:
+            message["id"] = message_id
+        if dedup_key:
+            message["dedup_key"] = dedup_key
+        return message
+
+    async def dispatch_message(self, message_body, subject, recipient, reply_subject=None, message_id=None, dedup_key=None):
+        message = self._build_message(message_body, subject, message_id, dedup_key)
         await self.mqueue_sender.send(message, recipient, reply_subject)
+
+    async def request_message(self, message_body, subject, recipient, timeout, message_id=None, dedup_key=None):
+        """Send a message over request/reply and return the decoded reply."""
+        message = self._build_message(message_body, subject, message_id, dedup_key)
+        return await self.mqueue_sender.request(message, recipient, timeout)
     
+    async def _single_flight(self, subject, handler):
+        """Run handler once for identical requests arriving together.
+
+        Requests for the same subject and state version share the running computation,
+        and are dropped if the same publish completed less than coalesce_window seconds ago.
+        """
+        key = (subject, self.schedule_interpreter.state_version)
+        loop = asyncio.get_running_loop()
+
+        running = self._inflight.get(key)
+        done_at = self._recently_done.get(key)
+        if running is not None or (done_at is not None and loop.time() - done_at < self.coalesce_window):
+            self.coalesced_counts[subject] = self.coalesced_counts.get(subject, 0) + 1
+            if running is not None:
+                await asyncio.shield(running)
+            return
+
+        task = asyncio.ensure_future(handler())
+        self._inflight[key] = task
+        try:
+            await asyncio.shield(task)
+        finally:
+            self._inflight.pop(key, None)
+            now = loop.time()
+            self._recently_done[key] = now
+            self.executed_counts[subject] = self.executed_counts.get(subject, 0) + 1
+            # Forget completions that are out of the window
+            for done_key in [k for k, t in self._recently_done.items() if now - t >= self.coalesce_window]:
+                del self._recently_done[done_key]
+
+    def get_coalescing_stats(self):
+        """Return how many requests were computed and how many were coalesced, per subject."""
+        return {
+            "window_secs": self.coalesce_window,
+            "executed": dict(self.executed_counts),
+            "coalesced": dict(self.coalesced_counts),
+        }
+
     async def handle_refresh(self):
+        await self._single_flight("refresh", self._refresh)
+
+    async def _refresh(self):
         await self.handle_get_schedule()
         await self.handle_get_next_actions()
         await self.handle_get_last_executed_action()
 
     async def handle_heartbeat(self):
-        await self.dispatch_message("alive", "heartbeat", "remote")
+        if self.heartbeat_report:
+            await self.dispatch_message(self.get_health_report(), "heartbeat", "remote")
+        else:
+            await self.dispatch_message("alive", "heartbeat", "remote")
 
     async def handle_commands_list(self, message_json):
         commands = message_json["body"]
@@ -81,15 +257,95 @@ class MessagingQueueHandler:
             await self.dispatch_message(command_reply_message, "log", "remote")
         return command_reply_message
     
-    async def handle_get_schedule(self):
+    async def handle_validate_schedule(self, message_json):
+        schedule_data = message_json["body"]
+        validation_report = await self.schedule_interpreter.validate_schedule(schedule_data)
+        await self.dispatch_message(validation_report, "schedule_validation", "remote")
+
+    async def handle_full_resync(self):
+        await self.schedule_interpreter.resync_current_state()
+
+    async def handle_get_schedule(self, message_json=None):
+        # A remote that sends the hash of the text it has only gets the text if it changed
+        query = message_json.get("body") if message_json else None
+        known_hash = query.get("hash") if isinstance(query, dict) else None
+        if known_hash and known_hash == self.schedule_interpreter.get_schedule_hash():
+            await self.dispatch_message({"hash": known_hash}, "schedule_unchanged", "remote")
+            return
+        await self._single_flight("get_schedule", self._publish_schedule)
+
+    async def handle_schedule_changed(self):
+        """Announce a schedule change as a diff against the last announced schedule."""
+        schedule_diff = self.schedule_interpreter.take_schedule_diff()
+        if schedule_diff is None:
+            await self.handle_get_schedule()
+        elif schedule_diff["hash"] != schedule_diff["previous_hash"]:
+            await self.dispatch_message(schedule_diff, "schedule_diff", "remote")
+
+    async def _publish_schedule(self):
         schedule = self.schedule_interpreter.get_schedule()
         await self.dispatch_message(schedule, "current_schedule", "remote")
 
     async def handle_get_next_actions(self):
+        await self._single_flight("get_next_actions", self._publish_next_actions)
+
+    async def _publish_next_actions(self):
         next_actions = self.schedule_interpreter.get_next_actions()
         await self.dispatch_message(next_actions, "next_actions", "remote")
     
     async def handle_get_last_executed_action(self):
+        await self._single_flight("get_last_executed_action", self._publish_last_executed_action)
+
+    async def _publish_last_executed_action(self):
         last_action = self.schedule_interpreter.get_last_executed_action()
         await self.dispatch_message(last_action, "last_executed_action", "remote")
-    
\ No newline at end of file
+
+    async def handle_get_execution_history(self, message_json):
+        query = message_json.get("body") or {}
+        if not isinstance(query, dict):
+            query = {}
+        try:
+            history = self.schedule_interpreter.get_execution_history(
+                start=datetime.fromisoformat(query["from"]) if query.get("from") else None,
+                end=datetime.fromisoformat(query["to"]) if query.get("to") else None,
+                cursor=query.get("cursor"),
+                # At least one record per page, so a client following next_cursor always advances
+                limit=max(1, min(int(query.get("limit", 50)), 500)),
+            )
+        except ValueError as e:
+            await self.dispatch_message({"success": False, "message": f"Execution history query error: {e}", "level": "error"}, "log", "remote")
+            return
+        await self.dispatch_message(history, "execution_history", "remote")
+
+    def _parse_request_date(self, date_str):
+        """Parse a date sent by a remote, either DD-MM-YYYY or ISO YYYY-MM-DD."""
+        try:
+            return datetime.strptime(date_str, "%d-%m-%Y").date()
+        except ValueError:
+            return date.fromisoformat(date_str)
+
+    async def handle_get_occurrences(self, message_json):
+        query = message_json["body"]
+        try:
+            occurrences = self.schedule_interpreter.get_occurrences(self._parse_request_date(query["from"]), self._parse_request_date(query["to"]))
+        except ValueError as e:
+            await self.dispatch_message({"success": False, "message": f"Occurrences query error: {e}", "level": "error"}, "log", "remote")
+            return
+
+        # Split long ranges over several messages to stay below the NATS payload limit
+        chunk_size = settings.mQueueMaxOccurrencesPerMessage
+        total = len(occurrences["timestamps"])
+        chunks = max(1, -(-total // chunk_size))
+        for chunk in range(chunks):
+            first = chunk * chunk_size
+            chunk_body = dict(occurrences)
+            chunk_body.update(
+                {
+                    "chunk": chunk,
+                    "chunks": chunks,
+                    "offset": first,
+                    "timestamps": occurrences["timestamps"][first : first + chunk_size],
+                    "action_ids": occurrences["action_ids"][first : first + chunk_size],
+                }
+            )
+            await self.dispatch_message(chunk_body, "occurrences", "remote")
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from dunebugger_logging import logger
+
+
+def available_runtimes():
+    """Return the event loop implementations usable on this host."""
+    return ["asyncio", "uvloop"] if uvloop else ["asyncio"]
+
+
+def get_loop_factory(runtime="auto"):
+    """Return (runtime name, loop factory) for a configured runtime, None meaning the default loop."""
+    if runtime in ["auto", "uvloop"] and uvloop:
+        return "uvloop", uvloop.new_event_loop
+    if runtime == "uvloop":
+        logger.warning("uvloop runtime requested but uvloop is not installed, using asyncio")
+    return "asyncio", None
+
+
+def install_eager_tasks(loop):
+    """Start tasks eagerly on Python 3.12+, so short handlers that never suspend skip a loop iteration."""
+    if sys.version_info >= (3, 12):
+        loop.set_task_factory(asyncio.eager_task_factory)
+        return True
+    return False
+
+
+def run(main, runtime="auto", eager_tasks=True):
+    """Run the coroutine function main on the configured event loop runtime."""
+    runtime_name, loop_factory = get_loop_factory(runtime)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        eager = eager_tasks and install_eager_tasks(runner.get_loop())
+        logger.info(f"Event loop runtime: {runtime_name}{' with eager tasks' if eager else ''}")
+        return runner.run(main())
+
+
+class _BenchmarkMessage:
+    def __init__(self, subject, data):
+        self.subject = subject
+        self.data = data
+        self.reply = None
+
+
+class _CountingSender:
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, message, recipient, reply_subject=None):
+        self.sent += 1
+
+
+async def _benchmark_messages(messages):
+    """Push messages through the real route dispatcher, one task per message as NATS does."""
+    from mqueue_handler import MessagingQueueHandler
+
+    handler = MessagingQueueHandler()
+    handler.mqueue_sender = _CountingSender()
+    heartbeat = _BenchmarkMessage("dunebugger.scheduler.heartbeat", b'{"body": null}')
+    states = _BenchmarkMessage("dunebugger.scheduler.commands_list", json.dumps({"body": ["command"] * 20}).encode())
+
+    class _Lists:
+        async def store_list(self, list_body, list_type):
+            pass
+
+    handler.schedule_interpreter = _Lists()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(handler.process_mqueue_message(heartbeat if index % 2 else states)) for index in range(messages)]
+    await asyncio.gather(*tasks)
+    return messages / (time.perf_counter() - started)
+
+
+async def _benchmark_timers(timers, load_messages):
+    """Measure how late timers fire while the loop is handling a message burst."""
+    loop = asyncio.get_running_loop()
+    lags = []
+
+    async def timer(delay):
+        due = loop.time() + delay
+        await asyncio.sleep(delay)
+        lags.append(loop.time() - due)
+
+    await asyncio.gather(*(timer(0.001 * (index % 100)) for index in range(timers)), _benchmark_messages(load_messages))
+    lags.sort()
+    return {
+        "p50_ms": round(lags[len(lags) // 2] * 1000, 3),
+        "p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 3),
+        "max_ms": round(lags[-1] * 1000, 3),
+    }
+
+
+async def _benchmark(messages, timers):
+    return {
+        "messages_per_sec": round(await _benchmark_messages(messages)),
+        "timer_lag": await _benchmark_timers(timers, messages // 4),
+    }
+
+
+def run_benchmark(messages=20000, timers=1000):
+    """Compare message throughput and timer lag of every available runtime on this hardware."""
+    results = {}
+    # Per-message logging would dominate the measure
+    previous_level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        for runtime in available_runtimes():
+            for eager_tasks in ([False, True] if sys.version_info >= (3, 12) else [False]):
+                _runtime_name, loop_factory = get_loop_factory(runtime)
+                with asyncio.Runner(loop_factory=loop_factory) as runner:
+                    if eager_tasks:
+                        install_eager_tasks(runner.get_loop())
+                    results[f"{runtime}{'+eager' if eager_tasks else ''}"] = runner.run(_benchmark(messages, timers))
+    finally:
+        logger.setLevel(previous_level)
+    return results
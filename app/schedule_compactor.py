@@ -0,0 +1,57 @@
+import asyncio
+from dunebugger_logging import logger
+
+
+class ScheduleCompactor:
+    """Archive expired special-date sections of schedule.conf at startup and then every interval.
+
+    Keeps the schedule file, its load time and the get_schedule payload bounded as years pass.
+    """
+
+    def __init__(self, schedule_interpreter, archive_file, retention_days=30, interval=86400):
+        self.schedule_interpreter = schedule_interpreter
+        self.archive_file = archive_file
+        self.retention_days = retention_days
+        self.interval = interval
+        self.last_run = None
+        self.archived_total = 0
+        self.compaction_task = None
+
+    async def start(self):
+        """Start the compaction task, a negative retention disables it"""
+        if self.retention_days < 0:
+            logger.info("Schedule compaction disabled")
+            return
+        self.compaction_task = asyncio.create_task(self._compaction_loop())
+
+    async def stop(self):
+        """Stop the compaction task"""
+        if self.compaction_task:
+            self.compaction_task.cancel()
+            try:
+                await self.compaction_task
+            except asyncio.CancelledError:
+                pass
+
+    async def compact(self):
+        """Run one compaction pass, returning the number of sections archived."""
+        try:
+            archived = await self.schedule_interpreter.compact_schedule(self.archive_file, self.retention_days)
+        except Exception as e:
+            logger.error(f"Schedule compaction failed: {e}")
+            return 0
+        self.last_run = self.schedule_interpreter.clock.now()
+        self.archived_total += archived
+        return archived
+
+    async def _compaction_loop(self):
+        while True:
+            await self.compact()
+            await asyncio.sleep(self.interval)
+
+    def get_status(self):
+        return {
+            "retention_days": self.retention_days,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "archived_total": self.archived_total,
+        }
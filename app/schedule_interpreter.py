@@ -2,25 +2,119 @@ from os import path
 import os
 import tempfile
 import asyncio
-from datetime import datetime, timedelta, time
-import re
+import hashlib
+import multiprocessing
+from datetime import datetime, timedelta
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
 from dunebugger_logging import logger
+from timezone_resolver import TimezoneResolver
+from scheduler_clock import SystemClock
+from compiled_schedule import CompiledSchedule, WEEKDAY_MAP, compile_schedule, save_compiled_schedule, load_compiled_schedule, split_expired_sections
+from execution_journal import OUTCOME_OK, OUTCOME_PARTIAL, OUTCOME_FAILED, OUTCOME_NO_COMMANDS, OUTCOME_UNACKED, OUTCOME_SUPERSEDED, FLAG_CLOCK_UNSYNCED, FLAG_DIFF, OUTCOME_NAMES
+
+# Limits of the get_occurrences range query
+MAX_OCCURRENCES_DAYS = 1830
+OCCURRENCES_CACHE_SIZE = 16
+
+# Days searched back for the action currently in effect
+CURRENT_ACTION_LOOKBACK_DAYS = 7
 
 class ScheduleInterpreter:
-    def __init__(self, mqueue_handler, state_tracker):
+    def __init__(self, mqueue_handler, state_tracker, execution_journal=None, clock_monitor=None, unsynced_clock_policy="flag", tz_resolver=None, clock=None, leader_election=None, catch_up_max_secs=600, command_ack=False, ack_timeout=2, ack_retries=3, ack_backoff_max=4, command_diff=True, compile_process_threshold=65536, solar_table=None, execution_policy="supersede"):
         self.mqueue_handler = mqueue_handler
         self.state_tracker = state_tracker
         self.commands = []
         self.states = []
         self.schedule_config = path.join(path.dirname(path.abspath(__file__)), "config/schedule.conf")
-        self.schedule = {'weekdays': {}, 'special_dates': {}}
+        self.schedule_cache = f"{self.schedule_config}.cache"
+        self.schedule = CompiledSchedule()
         self.next_action = None
         self.next_action_time = None
         self.weekdays = ['domenica', 'lunedì', 'martedì', 'mercoledì', 'giovedì', 'venerdì', 'sabato']
-        self._validation_schedule = {'weekdays': {}, 'special_dates': {}}
+        self._validation_schedule = CompiledSchedule()
         self.last_executed_action = None
         self.last_executed_time = None
+        self.last_success_time = None  # last execution with every command sent
+        self.last_delivery = None  # delivery outcome of the last executed action
         self._schedule_changed = asyncio.Event()
+        self._schedule_hash = None  # hash of the schedule.conf content currently loaded
+        self._occurrences_cache = OrderedDict()  # (first day, last day) -> columnar occurrences
+        # Schedule last announced to remotes, the baseline of the next published diff
+        self._published_schedule = None
+        self._published_hash = None
+        self.state_version = 0  # bumped whenever data published to remotes may have changed
+        # Actions of the active schedule whose state is missing from the states list -> reason
+        self.flagged_actions = {}
+        self.tz_resolver = tz_resolver or TimezoneResolver()
+        self.clock = clock or SystemClock(self.tz_resolver.tz)
+        self.execution_journal = execution_journal
+        self.clock_monitor = clock_monitor
+        self.unsynced_clock_policy = unsynced_clock_policy  # "flag" executes and marks the journal, "hold" waits for sync
+        # In HA mode only the lease holder dispatches, standbys keep the schedule and lists warm
+        self.leader_election = leader_election
+        self.catch_up_max_secs = catch_up_max_secs
+        # With command_ack every command waits for core to acknowledge it, with bounded retries
+        self.command_ack = command_ack
+        self.ack_timeout = ack_timeout
+        self.ack_retries = ack_retries
+        self.ack_backoff_max = ack_backoff_max
+        # With command_diff only the commands of a state that are not already in effect are sent.
+        # applied_commands is None when what core has applied is unknown, forcing a full resync.
+        self.command_diff = command_diff
+        self.applied_commands = None
+        # Uploads of at least compile_process_threshold characters are compiled in a worker process
+        self.compile_process_threshold = compile_process_threshold
+        self._compile_pool = None
+        self._update_lock = asyncio.Lock()
+        # Resolves sunrise/sunset entries, None when no location is configured
+        self.solar_table = solar_table
+        # Firings are executed one at a time by a worker, so the timer loop never waits for commands.
+        # With "supersede" a new firing cancels the execution in flight and drops queued ones,
+        # with "queue" every firing runs to completion in order.
+        self.execution_policy = execution_policy
+        self._execution_queue = asyncio.Queue()
+        self._firing_sequence = 0  # sequence number of the newest firing queued
+        self._current_execution = None
+        self.execution_task = None
+        self.firing_lags = deque(maxlen=200)  # seconds between planned time and execution start
+        self._restore_last_execution()
+
+    def _restore_last_execution(self):
+        """Restore the last executed state from the execution journal."""
+        if self.execution_journal is None:
+            return
+        try:
+            last_record = self.execution_journal.last()
+            if last_record:
+                self.last_executed_action = last_record['action']
+                self.last_executed_time = datetime.fromisoformat(last_record['executed']).astimezone(self.tz_resolver.tz)
+                if last_record['outcome'] == OUTCOME_NAMES[OUTCOME_OK]:
+                    self.last_success_time = self.last_executed_time
+                self.last_delivery = {
+                    'outcome': last_record['outcome'],
+                    'commands_delivered': last_record['commands_sent'],
+                    'commands_total': last_record['commands_total'],
+                }
+                logger.info("Restored last executed action '%s' at %s from journal", self.last_executed_action, self.last_executed_time)
+        except Exception as e:
+            logger.error("Failed to restore last executed action from journal: %s", e)
+
+    def _journal_execution(self, planned_time, action, commands_sent, commands_total, outcome, flags=0, started_time=None):
+        """Record an execution in the journal, without letting journal errors stop the scheduler.
+
+        The execution time recorded is when the execution started, so its lag is recorded too.
+        """
+        if self.execution_journal is None:
+            return
+        if self._is_clock_unsynchronized():
+            flags |= FLAG_CLOCK_UNSYNCED
+        try:
+            self.execution_journal.append(planned_time, started_time or self.clock.now(), action, commands_sent, commands_total, outcome, flags)
+        except Exception as e:
+            logger.error("Failed to write execution journal: %s", e)
 
     async def request_lists(self):
         """Request the commands ans states list from the dunebugger core."""
@@ -32,62 +126,278 @@ class ScheduleInterpreter:
         """Store the received commands list."""
         if list_type == "commands":
             self.commands = list_body
-            logger.info(f"Stored commands list with {len(list_body)} items")
+            logger.info("Stored commands list with %s items", len(list_body))
         elif list_type == "states":
+            previous_names = self._state_names()
             self.states = list_body
-            logger.info(f"Stored states list with {len(list_body)} items")
+            # State definitions may have changed, the next execution resends everything
+            self.applied_commands = None
+            logger.info("Stored states list with %s items", len(list_body))
+            await self._revalidate_actions(previous_names, self._state_names())
+        self.state_version += 1
+
+    async def _revalidate_actions(self, previous_names, current_names):
+        """Re-check the scheduled actions whose state was added to or removed from the states list.
+
+        Other actions cannot have changed validity, so the rest of the schedule is not rescanned.
+        Newly invalid and restored actions are flagged in the validation report and announced.
+        """
+        schedule = self._validation_schedule
+        if previous_names is None or current_names is None:
+            candidates = set(schedule.actions)
+        else:
+            candidates = previous_names ^ current_names
+
+        flagged = []
+        restored = []
+        for action in candidates:
+            if not schedule.get_action_entries(action):
+                continue
+            if current_names is not None and action in current_names:
+                if self.flagged_actions.pop(action, None):
+                    restored.append(action)
+            elif action not in self.flagged_actions:
+                self.flagged_actions[action] = f'State "{action}" not found in states list'
+                flagged.append({'action': action, 'reason': self.flagged_actions[action], 'entries': self._describe_action_entries(schedule, action)})
+
+        if flagged:
+            logger.warning("States list update invalidates scheduled actions: %s", ", ".join(item['action'] for item in flagged))
+        if flagged or restored:
+            await self.mqueue_handler.dispatch_message({'flagged': flagged, 'restored': sorted(restored)}, "schedule_actions_flagged", "remote")
+
+    def _describe_action_entries(self, schedule, action):
+        weekday_names = {weekday_num: name for name, weekday_num in WEEKDAY_MAP.items()}
+        entries = []
+        for section_type, section_key, index in schedule.get_action_entries(action):
+            table = schedule.weekdays[section_key] if section_type == "weekdays" else schedule.special_dates[section_key]
+            section = weekday_names[section_key] if section_type == "weekdays" else section_key
+            entries.append({'section': section, 'time': table.raw_times[index]})
+        return entries
 
     async def init_schedule(self):
         while True:
             try:
                 await self.request_lists()
-                self._validate_schedule_file(self.schedule_config)
+                schedule, content_hash = self._compile_schedule_file(self.schedule_config)
                 break
             except Exception as e:
-                logger.error(f"Schedule validation failed: {e}. Retrying in 60 seconds...")
+                logger.error("Schedule validation failed: %s. Retrying in 60 seconds...", e)
                 await asyncio.sleep(60)
 
-        self._load_schedule(self.schedule_config, self.schedule)
-        
-    def get_next_schedule(self):
-        """Get the next scheduled action based on the current time."""
-        now = datetime.now()
-        current_date_str = now.strftime('%d-%m-%Y')
-        current_time = now.time()
-        current_weekday = now.weekday()
-        
-        # Check for special date first (overrides weekday)
-        if current_date_str in self.schedule['special_dates']:
-            schedule_items = self.schedule['special_dates'][current_date_str]
-            next_action = self._find_next_action_in_day(schedule_items, current_time)
-            if next_action:
-                execution_time = datetime.combine(now.date(), next_action['time'])
-                if execution_time <= now:
-                    execution_time += timedelta(days=1)
-                wait_seconds = (execution_time - now).total_seconds()
-                return next_action['action'], wait_seconds, execution_time
-        
-        # Check current weekday schedule
-        if current_weekday in self.schedule['weekdays']:
-            schedule_items = self.schedule['weekdays'][current_weekday]
-            next_action = self._find_next_action_in_day(schedule_items, current_time)
-            if next_action:
-                execution_time = datetime.combine(now.date(), next_action['time'])
-                if execution_time <= now:
-                    # Look for next day's first action
-                    return self._get_next_day_first_action(now)
-                wait_seconds = (execution_time - now).total_seconds()
-                return next_action['action'], wait_seconds, execution_time
+        self._swap_schedule(schedule, content_hash)
+
+    def _hash_content(self, content):
+        """Return the hash used to recognise a given schedule.conf content."""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    def _hash_file(self, file_path):
+        with open(file_path, 'rb') as f:
+            return self._hash_content(f.read())
+
+    def _states_version(self):
+        """Return a digest of what validation depends on besides the content: the state names and solar availability."""
+        if isinstance(self.states, dict):
+            names = sorted(self.states)
+        else:
+            names = sorted(state.get('name', '') if isinstance(state, dict) else str(state) for state in self.states)
+        # Sunrise/sunset entries are rejected without a location, a cache compiled with one must not be reused
+        solar = "solar" if self.solar_table is not None else "no-solar"
+        return hashlib.blake2b("\n".join(names + [f"\0{solar}"]).encode('utf-8'), digest_size=16).digest()
+
+    def _write_schedule_cache(self, schedule, content_hash):
+        try:
+            save_compiled_schedule(schedule, self.schedule_cache, content_hash, self._states_version())
+        except Exception as e:
+            logger.warning("Failed to write compiled schedule cache %s: %s", self.schedule_cache, e)
+
+    def _compile_schedule_file(self, file_path):
+        """Compile a schedule file, returning it with its content hash.
+
+        The compiled cache is used when it was built from the same content, states list and solar availability,
+        otherwise the file is parsed and the cache regenerated.
+        """
+        with open(file_path, 'rb') as f:
+            raw_content = f.read()
+        content_hash = self._hash_content(raw_content)
+
+        schedule = load_compiled_schedule(self.schedule_cache, content_hash, self._states_version())
+        if schedule is not None:
+            logger.info("Schedule loaded from compiled cache. Weekdays: %s, Special dates: %s", len(schedule.weekdays), len(schedule.special_dates))
+            return schedule, content_hash
+
+        schedule = self._load_schedule(file_path, raw_content.decode('utf-8'))
+        self._write_schedule_cache(schedule, content_hash)
+        return schedule, content_hash
+
+    def _drop_past_special_dates(self, schedule):
+        """Remove special dates no longer needed to look up current or upcoming actions.
+
+        Dates stay in schedule.conf until compaction archives them, this only keeps them out of memory.
+        """
+        today = self.clock.now().astimezone(self.tz_resolver.tz).date()
+        expired = schedule.drop_special_dates_before(today - timedelta(days=CURRENT_ACTION_LOOKBACK_DAYS))
+        if expired:
+            logger.info("Dropped %s past special dates from the active schedule", len(expired))
+        return expired
+
+    def _swap_schedule(self, schedule, content_hash):
+        """Replace the active schedule with an already compiled one."""
+        self._drop_past_special_dates(schedule)
+        self.schedule = schedule
+        self._validation_schedule = schedule
+        # Compiled against the current states list, every action is valid
+        self.flagged_actions = {}
+        self._schedule_hash = content_hash
+        self._occurrences_cache.clear()
+        self.state_version += 1
+
+    def _named_sections(self, schedule):
+        weekday_names = {weekday_num: name for name, weekday_num in WEEKDAY_MAP.items()}
+        sections = {weekday_names[weekday]: table for weekday, table in schedule.weekdays.items()}
+        sections.update(schedule.special_dates)
+        return sections
+
+    def _diff_schedules(self, previous, current):
+        """Return the sections added, removed and changed between two compiled schedules."""
+        previous_sections = self._named_sections(previous)
+        current_sections = self._named_sections(current)
+        diff = {
+            'sections_added': {name: [{'time': raw_time, 'action': action} for raw_time, action in self._section_entries(current_sections[name])] for name in current_sections.keys() - previous_sections.keys()},
+            'sections_removed': sorted(previous_sections.keys() - current_sections.keys()),
+            'sections_changed': {},
+        }
+        for name in previous_sections.keys() & current_sections.keys():
+            if previous_sections[name] is current_sections[name]:
+                continue
+            old_entries = set(self._section_entries(previous_sections[name]))
+            new_entries = set(self._section_entries(current_sections[name]))
+            if old_entries == new_entries:
+                continue
+            removed = dict(old_entries - new_entries)
+            added = dict(new_entries - old_entries)
+            diff['sections_changed'][name] = {
+                'added': [{'time': raw_time, 'action': action} for raw_time, action in sorted(added.items()) if raw_time not in removed],
+                'removed': [{'time': raw_time, 'action': action} for raw_time, action in sorted(removed.items()) if raw_time not in added],
+                'changed': [{'time': raw_time, 'from': removed[raw_time], 'to': action} for raw_time, action in sorted(added.items()) if raw_time in removed],
+            }
+        return diff
+
+    def _section_entries(self, table):
+        return [(table.raw_times[index], table.get_action(index)) for index in range(len(table))]
+
+    def get_schedule_hash(self):
+        """Hash of the active schedule.conf: the sha256 hex digest of its UTF-8 content."""
+        return self._schedule_hash
+
+    def take_schedule_diff(self):
+        """Diff the active schedule against the one last announced to remotes, and make it the new baseline.
+
+        Returns None when there is no baseline yet, remotes then need the full text.
+        """
+        previous, previous_hash = self._published_schedule, self._published_hash
+        self._published_schedule, self._published_hash = self.schedule, self._schedule_hash
+        if previous is None or previous_hash is None:
+            return None
+        return {
+            'hash': self._schedule_hash,
+            'previous_hash': previous_hash,
+            'diff': self._diff_schedules(previous, self.schedule),
+        }
+
+    async def reload_schedule_from_file(self):
+        """Reload schedule.conf after an external edit, keeping the current schedule if it is invalid."""
+        try:
+            content_hash = await asyncio.to_thread(self._hash_file, self.schedule_config)
+            if content_hash == self._schedule_hash:
+                # Unchanged content, or a file written by the scheduler itself
+                return False
+
+            # Parsing happens off the event loop, only the finished schedule is swapped in
+            schedule, content_hash = await asyncio.to_thread(self._compile_schedule_file, self.schedule_config)
+        except Exception as e:
+            logger.error("Ignoring external change to %s: %s", self.schedule_config, e)
+            return False
+
+        self._swap_schedule(schedule, content_hash)
+        self._schedule_changed.set()
+        self.state_tracker.notify_update("schedule")
+        logger.info("Schedule reloaded after external change to schedule file")
+        return True
         
-        # No action found for today, get next day's first action
-        return self._get_next_day_first_action(now)
+    def _iter_day_occurrences(self, first_day, days):
+        """Yield (execution_time, action_id) for every action of days local days starting at first_day.
+
+        Each execution time is resolved once to an aware instant in the scheduler timezone,
+        action_id indexes into self.schedule.actions. Entries resolving to the same instant, as
+        skipped times shifted to the end of a DST gap do, yield only the latest in wall-clock order.
+        """
+        for days_ahead in range(days):
+            day = first_day + timedelta(days=days_ahead)
+            table = self.schedule.get_day_table(day)
+            if table is None:
+                continue
+            pending = None
+            for entry_time, index in table.get_day_times(day, self.solar_table):
+                execution_time = self.tz_resolver.resolve(day, entry_time)
+                if execution_time is None:
+                    continue
+                if pending is not None and pending[0].timestamp() != execution_time.timestamp():
+                    yield pending
+                pending = (execution_time, table.action_ids[index])
+            if pending is not None:
+                yield pending
+
+    def _iter_occurrences(self, start, max_days):
+        """Yield (execution_time, action_id) for every action strictly after start, for up to max_days local days.
+
+        Comparisons are done on timestamps so they stay correct across DST transitions.
+        """
+        start_ts = start.timestamp()
+        first_day = start.astimezone(self.tz_resolver.tz).date()
+        for execution_time, action_id in self._iter_day_occurrences(first_day, max_days):
+            if execution_time.timestamp() > start_ts:
+                yield execution_time, action_id
+
+    def get_next_schedule(self, after=None):
+        """Get the next scheduled action after a planned time, by default after the current time.
+
+        The wait is counted from the current time, and is negative for an action already due.
+        """
+        now = self.clock.now()
+
+        # Look at today and the next 7 days to find a schedule
+        for execution_time, action_id in self._iter_occurrences(after or now, 8):
+            wait_seconds = execution_time.timestamp() - now.timestamp()
+            return self.schedule.actions[action_id], wait_seconds, execution_time
+
+        # No schedule found in next 7 days
+        logger.warning("No schedule found in the next 7 days")
+        return None
 
     async def update_schedule(self, schedule_data):
-        """Update the schedule with the received data."""
+        """Update the schedule with the received data, one update at a time."""
+        async with self._update_lock:
+            return await self._update_schedule(schedule_data)
+
+    async def _update_schedule(self, schedule_data):
         temp_file = None
         backup_file = None
         
         try:
+            # Validate the whole upload first, so every problem is reported in one reply
+            schedule, diagnostics = await self._compile_schedule_offloaded(schedule_data)
+            errors = [d for d in diagnostics if d['level'] == 'error']
+            if errors:
+                logger.error("Schedule update rejected: %s errors, first at %s", len(errors), self._format_diagnostic(errors[0]))
+                return {
+                    "success": False,
+                    "message": f"Schedule update error: {len(errors)} errors found",
+                    "level": "error",
+                    "diagnostics": diagnostics
+                }
+
             # Create a temporary file with random name in the config folder
             config_dir = path.dirname(self.schedule_config)
             temp_fd, temp_file = tempfile.mkstemp(suffix='.conf', prefix='schedule_temp_', dir=config_dir)
@@ -96,22 +406,23 @@ class ScheduleInterpreter:
             with os.fdopen(temp_fd, 'w', encoding='utf-8') as f:
                 f.write(schedule_data)
             
-            # Validate the temporary schedule file
-            self._validate_schedule_file(temp_file)
-            
             # If validation passes, create backup of current schedule
             backup_file = f"{self.schedule_config}.backup"
             with open(self.schedule_config, 'r', encoding='utf-8') as src:
                 with open(backup_file, 'w', encoding='utf-8') as dst:
                     dst.write(src.read())
             
+            content_hash = self._hash_content(schedule_data)
+
+            # Record the new hash before promoting, so the file watcher recognises our own write
+            self._schedule_hash = content_hash
+
             # Promote temporary file to active schedule
             os.replace(temp_file, self.schedule_config)
             temp_file = None  # Don't delete in finally block since it's now the active file
-            
-            # Reload the schedule
-            self.schedule = {'weekdays': {}, 'special_dates': {}}
-            self._load_schedule(self.schedule_config, self.schedule)
+            # Cached before the swap, which drops past special dates from the schedule
+            self._write_schedule_cache(schedule, content_hash)
+            self._swap_schedule(schedule, content_hash)
             
             # Signal that schedule has changed to interrupt any waiting
             self._schedule_changed.set()
@@ -120,10 +431,10 @@ class ScheduleInterpreter:
             self.state_tracker.notify_update("schedule")
 
             logger.info("Schedule updated successfully")
-            return {"success": True, "message": "Schedule updated successfully", "level": "info"}
+            return {"success": True, "message": "Schedule updated successfully", "level": "info", "diagnostics": diagnostics}
         
         except Exception as e:
-            logger.error(f"Schedule update failed: {e}")
+            logger.error("Schedule update failed: %s", e)
             return {"success": False, "message": f"Schedule update error: {str(e)}", "level": "error"}
         finally:
             # Clean up temporary file if it still exists
@@ -131,30 +442,182 @@ class ScheduleInterpreter:
                 try:
                     os.unlink(temp_file)
                 except Exception as cleanup_error:
-                    logger.warning(f"Failed to cleanup temporary file {temp_file}: {cleanup_error}")
+                    logger.warning("Failed to cleanup temporary file %s: %s", temp_file, cleanup_error)
+
+    async def compact_schedule(self, archive_file, retention_days):
+        """Move special-date sections older than retention_days from schedule.conf to archive_file.
+
+        The archive is appended to before schedule.conf is atomically rewritten, so a crash in
+        between can only leave a section in both files. Returns the number of sections archived.
+        """
+        async with self._update_lock:
+            # Dates passed since the schedule was loaded leave memory whether or not they are archived yet
+            if self._drop_past_special_dates(self.schedule):
+                self._occurrences_cache.clear()
+
+            # newline='' keeps CRLF line endings, so the content hashes like the file's bytes
+            with open(self.schedule_config, 'r', encoding='utf-8', newline='') as f:
+                content = f.read()
+            if self._hash_content(content) != self._schedule_hash:
+                # Edited outside the scheduler and not reloaded yet, leave it to the file watcher
+                logger.info("Skipping schedule compaction: %s changed since it was loaded", self.schedule_config)
+                return 0
+
+            before = self.clock.now().date() - timedelta(days=retention_days)
+            kept_content, expired_content, expired_keys = split_expired_sections(content, before)
+            if not expired_keys:
+                return 0
+
+            schedule, diagnostics = await self._compile_schedule_offloaded(kept_content)
+            errors = [d for d in diagnostics if d['level'] == 'error']
+            if errors:
+                logger.error("Schedule compaction aborted: %s", self._format_diagnostic(errors[0]))
+                return 0
+
+            with open(archive_file, 'a', encoding='utf-8') as f:
+                f.write(f"# Archived from {path.basename(self.schedule_config)} on {self.clock.now().date().isoformat()}\n")
+                f.write(expired_content if expired_content.endswith('\n') else expired_content + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            temp_fd, temp_file = tempfile.mkstemp(suffix='.conf', prefix='schedule_temp_', dir=path.dirname(self.schedule_config))
+            try:
+                with os.fdopen(temp_fd, 'w', encoding='utf-8', newline='') as f:
+                    f.write(kept_content)
+                content_hash = self._hash_content(kept_content)
+                # Record the new hash before promoting, so the file watcher recognises our own write
+                self._schedule_hash = content_hash
+                os.replace(temp_file, self.schedule_config)
+            except Exception:
+                os.unlink(temp_file)
+                raise
+
+            self._write_schedule_cache(schedule, content_hash)
+            self._swap_schedule(schedule, content_hash)
+            # Only past dates were removed, upcoming firings are unchanged and the timer keeps waiting
+            self.state_tracker.notify_update("schedule")
+            logger.info("Archived %s expired special dates to %s: %s", len(expired_keys), archive_file, ", ".join(expired_keys))
+            return len(expired_keys)
 
     async def _interruptible_sleep(self, seconds):
         """Sleep that can be interrupted by schedule changes."""
-        try:
-            await asyncio.wait_for(self._schedule_changed.wait(), timeout=seconds)
+        if await self.clock.wait_event(self._schedule_changed, seconds):
             # If we get here, the schedule was changed - clear the event for next time
             self._schedule_changed.clear()
             logger.info("Sleep interrupted by schedule change")
             return True  # Schedule was changed
-        except asyncio.TimeoutError:
-            # Normal timeout - no schedule change
-            return False
+        # Normal timeout - no schedule change
+        return False
+
+    def _is_clock_unsynchronized(self):
+        """True only when the clock monitor positively reports an unsynchronized clock."""
+        return self.clock_monitor is not None and self.clock_monitor.is_synchronized() is False
+
+    async def _wait_for_clock_sync(self):
+        """Hold executions until the system clock is synchronized."""
+        logger.warning("System clock not synchronized, holding scheduled executions")
+        while self._is_clock_unsynchronized():
+            await self._interruptible_sleep(self.clock_monitor.check_interval)
+        logger.info("System clock synchronized, resuming scheduled executions")
+
+    def _is_leader(self):
+        return self.leader_election is None or self.leader_election.is_leader
+
+    async def _standby_until_leader(self):
+        """Wait for the lease, then run the action the previous leader missed, if any."""
+        logger.info("Scheduler in standby, waiting for leadership")
+        self.next_action = None
+        self.next_action_time = None
+        await self.leader_election.wait_for_leadership()
+        # What core has applied was decided by the previous leader
+        self.applied_commands = None
+
+        last_planned_ts = self.leader_election.last_planned_ts
+        current = self._get_current_scheduled_action(self.clock.now())
+        if last_planned_ts is None or not current:
+            return
+        action, execution_time = current
+        # Only an action due after the last one the previous leader ran, and not too long ago
+        if execution_time.timestamp() > last_planned_ts and self.clock.now().timestamp() - execution_time.timestamp() <= self.catch_up_max_secs:
+            logger.info("Catching up on '%s' planned at %s, missed during failover", action, execution_time)
+            self._enqueue_execution(action, execution_time)
+
+    async def _execute_and_record(self, action, execution_time):
+        try:
+            await self._execute_scheduled_action(action, execution_time)
+        finally:
+            if self.leader_election:
+                await self.leader_election.record_execution(execution_time)
+
+    def _enqueue_execution(self, action, execution_time, full_resync=False):
+        """Hand a firing to the execution worker, applying the overlap policy."""
+        self._firing_sequence += 1
+        if self.execution_policy == "supersede" and self._current_execution and not self._current_execution.done():
+            # Only the newest state matters, whatever has not been applied yet is replaced
+            self._current_execution.cancel()
+        self._execution_queue.put_nowait((self._firing_sequence, action, execution_time, full_resync))
+
+    async def _execution_worker(self):
+        """Execute queued firings one at a time."""
+        while True:
+            sequence, action, execution_time, full_resync = await self._execution_queue.get()
+            if self.execution_policy == "supersede" and sequence != self._firing_sequence:
+                # Journaled here rather than when superseded, so the journal stays in time order
+                logger.info("Dropping queued '%s' planned at %s: superseded by a newer state", action, execution_time)
+                self._journal_execution(execution_time, action, [], 0, OUTCOME_SUPERSEDED)
+                continue
+            if full_resync:
+                self._current_execution = asyncio.create_task(self._execute_scheduled_action(action, execution_time, full_resync=True))
+            else:
+                self._current_execution = asyncio.create_task(self._execute_and_record(action, execution_time))
+            try:
+                await self._current_execution
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                logger.info("Execution of '%s' planned at %s superseded by a newer state", action, execution_time)
+            except Exception as e:
+                logger.error("Error executing scheduled action '%s': %s", action, e)
+            finally:
+                self._current_execution = None
 
     async def run_scheduler(self):
-        """Run the scheduler to execute actions based on the schedule."""
+        """Run the scheduler: a timer loop firing scheduled actions into the execution queue."""
         logger.info("Starting scheduler service")
-        
+        self.execution_task = asyncio.create_task(self._execution_worker())
+        try:
+            await self._run_timeline()
+        finally:
+            self.execution_task.cancel()
+            try:
+                await self.execution_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run_timeline(self):
+        """Wait for each scheduled action in turn and fire it.
+
+        The next action is looked up after the planned time of the last one fired, so actions
+        that became due while the loop was busy still fire, late, instead of being skipped.
+        """
+        cursor = None
         while True:
             try:
+                if not self._is_leader():
+                    await self._standby_until_leader()
+                    cursor = None
+                    continue
+
+                # Missed actions older than catch_up_max_secs are skipped, as on failover
+                if cursor is not None and self.clock.now().timestamp() - cursor.timestamp() > self.catch_up_max_secs:
+                    logger.warning("Scheduler fell behind its timeline since %s, skipping to the current time", cursor)
+                    cursor = None
+
                 # Get next scheduled action
-                result = self.get_next_schedule()
+                result = self.get_next_schedule(cursor)
                 if not result:
                     # No schedule found, wait and try again (interruptible)
+                    cursor = None
                     await self._interruptible_sleep(60)  # Check every minute
                     continue
                 
@@ -164,191 +627,267 @@ class ScheduleInterpreter:
                 self.next_action = action
                 self.next_action_time = execution_time
                 
-                logger.info(f"Next action: '{action}' scheduled at {execution_time} (waiting {wait_seconds:.0f} seconds)")
+                logger.info("Next action: '%s' scheduled at %s (waiting %.0f seconds)", action, execution_time, wait_seconds)
                 
                 # Wait until execution time (interruptible)
                 if wait_seconds > 0:
                     schedule_changed = await self._interruptible_sleep(wait_seconds)
                     if schedule_changed:
                         logger.info("Schedule changed during wait, recalculating next action")
+                        cursor = None
                         continue  # Skip to recalculate with new schedule
+
+                if not self._is_leader():
+                    logger.info("Not executing '%s': leadership lost while waiting", action)
+                    continue
                 
+                if self._is_clock_unsynchronized():
+                    if self.unsynced_clock_policy == "hold":
+                        await self._wait_for_clock_sync()
+                        # Time may have moved on while holding, apply the state that is due now
+                        current = self._get_current_scheduled_action(self.clock.now())
+                        if current:
+                            action, execution_time = current
+                    else:
+                        logger.warning("Executing '%s' while the system clock is not synchronized", action)
+
                 # Execute the action
-                logger.info(f"Executing scheduled action: {action}")
-                await self._execute_scheduled_action(action)
-                
-                # Small delay before checking for next action (also interruptible)
-                await self._interruptible_sleep(10)
+                logger.info("Firing scheduled action: %s", action)
+                self._enqueue_execution(action, execution_time)
+                cursor = execution_time
                 
             except Exception as e:
-                logger.error(f"Error in scheduler loop: {e}")
+                logger.error("Error in scheduler loop: %s", e)
                 # Wait before retrying to avoid tight error loops (interruptible)
                 await self._interruptible_sleep(30)
     
-    def _is_special_date(self, section_name):
-        """Check if section name represents a special date."""
-        # Match DD-MM-YYYY or DD/MM/YYYY format
-        # Replace '/' with '-' for uniformity
-        section_name = section_name.replace('/', '-')
-        date_pattern = r'^\d{1,2}-\d{1,2}-\d{4}$'
-        return bool(re.match(date_pattern, section_name))
-    
-    def _validate_date_format(self, date_str):
-        """Validate date format DD-MM-YYYY or DD/MM/YYYY."""
-        # Replace '/' with '-' for uniformity
-        date_str = date_str.replace('/', '-')
-        for fmt in ['%d-%m-%Y']:
-            datetime.strptime(date_str, fmt)
-    
-    def _validate_time_format(self, time_str):
-        """Validate time format HH:MM, H:MM, H:M, or HH:M."""
-        time_pattern = r'^\d{1,2}:\d{1,2}$'
-        if not re.match(time_pattern, time_str):
-            raise ValueError(f"Time string does not match pattern HH:MM: {time_str}")
-        
-        # Additional validation for valid time values
-        #try:
-        self._parse_time(time_str)
-        return True
-        #except ValueError:
-        #    return False
-    
-    def _parse_time(self, time_str):
-        """Parse time string to time object."""
-        try:
-            parts = time_str.split(':')
-            if len(parts) != 2:
-                raise ValueError(f"Invalid time format: {time_str}")
-            
-            hour = int(parts[0])
-            minute = int(parts[1])
-            
-            if hour < 0 or hour > 23:
-                raise ValueError(f"Invalid hour: {hour}")
-            if minute < 0 or minute > 59:
-                raise ValueError(f"Invalid minute: {minute}")
-                
-            return time(hour, minute)
-        except Exception as e:
-            raise ValueError(f"Failed to parse time '{time_str}': {e}")
-    
-    def _find_next_action_in_day(self, schedule_items, current_time):
-        """Find the next action in the given day's schedule."""
-        for item in schedule_items:
-            if item['time'] > current_time:
-                return item
-        return None
-    
-    def _get_next_day_first_action(self, now):
-        """Get the first action of the next available day."""
-        # Look for the next 7 days to find a schedule
-        for days_ahead in range(1, 8):
-            future_date = now + timedelta(days=days_ahead)
-            future_date_str = future_date.strftime('%d-%m-%Y')
-            future_weekday = future_date.weekday()
-            
-            # Check special dates first
-            if future_date_str in self.schedule['special_dates']:
-                schedule_items = self.schedule['special_dates'][future_date_str]
-                if schedule_items:
-                    first_action = schedule_items[0]
-                    execution_time = datetime.combine(future_date.date(), first_action['time'])
-                    wait_seconds = (execution_time - now).total_seconds()
-                    return first_action['action'], wait_seconds, execution_time
-            
-            # Check weekday schedule
-            if future_weekday in self.schedule['weekdays']:
-                schedule_items = self.schedule['weekdays'][future_weekday]
-                if schedule_items:
-                    first_action = schedule_items[0]
-                    execution_time = datetime.combine(future_date.date(), first_action['time'])
-                    wait_seconds = (execution_time - now).total_seconds()
-                    return first_action['action'], wait_seconds, execution_time
-        
-        # No schedule found in next 7 days
-        logger.warning("No schedule found in the next 7 days")
+    def _get_current_scheduled_action(self, now):
+        """Get the most recent action due at or before now, with its execution time."""
+        now_ts = now.timestamp()
+        today = now.astimezone(self.tz_resolver.tz).date()
+
+        # Look back over the last days for the latest past action
+        for days_back in range(0, CURRENT_ACTION_LOOKBACK_DAYS + 1):
+            day = today - timedelta(days=days_back)
+            table = self.schedule.get_day_table(day)
+            if table is None:
+                continue
+            for entry_time, index in reversed(table.get_day_times(day, self.solar_table)):
+                execution_time = self.tz_resolver.resolve(day, entry_time)
+                if execution_time is not None and execution_time.timestamp() <= now_ts:
+                    return table.get_action(index), execution_time
+
         return None
+
+    def _is_nack(self, reply):
+        """A reply is an ack unless core explicitly reports a failure."""
+        ack = reply.get('body', reply) if isinstance(reply, dict) else reply
+        return isinstance(ack, dict) and ack.get('success') is False
+
+    async def _execute_command(self, command, dedup_key):
+        """Execute a single command via message queue, return whether core acknowledged it.
+
+        Without command acks a published command counts as delivered. The id is unique per
+        command, the dedup_key is the same for every retry so core can drop duplicates.
+        """
+        message_id = uuid.uuid4().hex
+        if not self.command_ack:
+            try:
+                logger.info("Executing command: %s", command)
+                await self.mqueue_handler.dispatch_message(command, "dunebugger_set", "core", message_id=message_id, dedup_key=dedup_key)
+                return True
+            except Exception as e:
+                logger.error("Failed to execute command '%s': %s", command, e)
+                raise
+
+        attempts = self.ack_retries + 1
+        for attempt in range(attempts):
+            try:
+                logger.info("Executing command: %s (attempt %s/%s)", command, attempt + 1, attempts)
+                reply = await self.mqueue_handler.request_message(command, "dunebugger_set", "core", self.ack_timeout, message_id=message_id, dedup_key=dedup_key)
+                if not self._is_nack(reply):
+                    return True
+                # Retrying a command core refused would not change the answer
+                logger.error("Command '%s' rejected by core: %s", command, reply)
+                return False
+            except Exception as e:
+                logger.warning("No acknowledgement for command '%s': %s", command, str(e) or type(e).__name__)
+            if attempt < attempts - 1:
+                await self.clock.sleep(min(self.ack_backoff_max, 0.5 * 2**attempt))
+
+        logger.error("Command '%s' not acknowledged after %s attempts", command, attempts)
+        return False
     
-    async def _execute_command(self, command):
-        """Execute a single command via message queue."""
-        try:
-            logger.info(f"Executing command: {command}")
-            await self.mqueue_handler.dispatch_message(command, "dunebugger_set", "core")
-        except Exception as e:
-            logger.error(f"Failed to execute command '{command}': {e}")
-            raise
-    
-    async def _execute_scheduled_action(self, state_name):
+    def _commands_to_send(self, commands, full_resync):
+        """Return (index, command) pairs to send for a state, and whether they are a diff."""
+        if full_resync or not self.command_diff or self.applied_commands is None:
+            return list(enumerate(commands)), False
+        return [(index, command) for index, command in enumerate(commands) if command not in self.applied_commands], True
+
+    async def resync_current_state(self):
+        """Send every command of the state due now, whatever was applied before."""
+        if not self._is_leader():
+            logger.info("Ignoring full resync request: not the scheduler leader")
+            return
+        current = self._get_current_scheduled_action(self.clock.now())
+        if not current:
+            logger.warning("Full resync requested but no state is due")
+            return
+        action, execution_time = current
+        logger.info("Full resync of state '%s'", action)
+        self._enqueue_execution(action, execution_time, full_resync=True)
+
+    async def _execute_scheduled_action(self, state_name, planned_time=None, full_resync=False):
         """Execute a state by retrieving and executing its associated commands."""
+        commands = []
+        to_send = []
+        commands_sent = []
+        unacked_commands = []
+        started_time = self.clock.now()
+        # Stable across retries and replicas, so core can recognise a command it already applied
+        dedup_prefix = f"{state_name}@{int((planned_time or started_time).timestamp())}"
+        if full_resync:
+            # A resync must be applied even though core already saw the firing it repeats
+            dedup_prefix += f"/resync@{int(started_time.timestamp() * 1000)}"
+        # A resync repeats a state that may have been current for hours, how late it runs is not a firing lag
+        journal_planned = None if full_resync else planned_time
+        lag = started_time.timestamp() - planned_time.timestamp() if journal_planned else None
+        if lag is not None:
+            self.firing_lags.append(lag)
         try:
-            logger.info(f"Executing state: {state_name}")
+            logger.info("Executing state: %s (lag %.3fs)", state_name, lag or 0.0)
             
             # Execute commands associated with the state
             commands = self.states[state_name]['commands']
 
             if not commands:
-                logger.warning(f"State '{state_name}' has no associated commands")
+                logger.warning("State '%s' has no associated commands", state_name)
                 # Still track execution even if no commands
                 self.last_executed_action = state_name
-                self.last_executed_time = datetime.now()
+                self.last_executed_time = self.clock.now()
+                self.last_delivery = {'outcome': OUTCOME_NAMES[OUTCOME_NO_COMMANDS], 'commands_delivered': 0, 'commands_total': 0, 'lag_ms': self._lag_ms(lag)}
+                self.state_version += 1
+                self._journal_execution(journal_planned, state_name, commands_sent, 0, OUTCOME_NO_COMMANDS, started_time=started_time)
                 return
             
-            for i, command in enumerate(commands):
-                logger.info(f"Executing state command {i+1}/{len(commands)}: {command}")
-                await self._execute_command(command)
+            to_send, is_diff = self._commands_to_send(commands, full_resync)
+            if is_diff:
+                logger.info("Sending %s of %s commands, the others are already in effect", len(to_send), len(commands))
+
+            for position, (i, command) in enumerate(to_send):
+                logger.info("Executing state command %s/%s: %s", i+1, len(commands), command)
+                if await self._execute_command(command, f"{dedup_prefix}#{i}"):
+                    commands_sent.append(command)
+                else:
+                    unacked_commands.append(command)
                 
                 # Small delay between commands to avoid overwhelming the system
-                if i < len(commands) - 1:  # Don't delay after the last command
-                    await asyncio.sleep(1.5)
+                if position < len(to_send) - 1:  # Don't delay after the last command
+                    await self.clock.sleep(1.5)
             
-            # Track the successful execution
+            # Track the execution and whether core got every command, unknown state forces a full resync next time
+            outcome = OUTCOME_UNACKED if unacked_commands else OUTCOME_OK
+            self.applied_commands = None if unacked_commands else set(commands)
             self.last_executed_action = state_name
-            self.last_executed_time = datetime.now()
+            self.last_executed_time = self.clock.now()
+            self.last_delivery = {
+                'outcome': OUTCOME_NAMES[outcome],
+                'commands_delivered': len(commands_sent),
+                'commands_total': len(to_send),
+                'diff': is_diff,
+                'lag_ms': self._lag_ms(lag),
+            }
+            if unacked_commands:
+                self.last_delivery['unacked_commands'] = unacked_commands
+            else:
+                self.last_success_time = self.last_executed_time
+            self.state_version += 1
+            self._journal_execution(journal_planned, state_name, commands_sent, len(to_send), outcome, FLAG_DIFF if is_diff else 0, started_time)
 
             # Notify state tracker about schedule update
             self.state_tracker.notify_update("near_actions")
 
-            logger.info(f"Successfully executed state '{state_name}' at {self.last_executed_time}")
+            if unacked_commands:
+                logger.warning("Executed state '%s' at %s, %s of %s commands not acknowledged", state_name, self.last_executed_time, len(unacked_commands), len(to_send))
+            else:
+                logger.info("Successfully executed state '%s' at %s", state_name, self.last_executed_time)
                     
+        except asyncio.CancelledError:
+            # Superseded by a newer state, what core has applied is now unknown
+            self.applied_commands = None
+            self._journal_execution(journal_planned, state_name, commands_sent, len(to_send or commands), OUTCOME_SUPERSEDED, started_time=started_time)
+            raise
         except Exception as e:
-            logger.error(f"Failed to execute state '{state_name}': {e}")
+            logger.error("Failed to execute state '%s': %s", state_name, e)
+            self.applied_commands = None
+            outcome = OUTCOME_PARTIAL if commands_sent else OUTCOME_FAILED
+            self._journal_execution(journal_planned, state_name, commands_sent, len(to_send or commands), outcome, started_time=started_time)
             raise
+
+    def _lag_ms(self, lag):
+        return round(lag * 1000, 1) if lag is not None else None
+
+    def get_firing_lag_stats(self):
+        """Lag between planned time and execution start of the recent firings, in milliseconds."""
+        lags = sorted(self.firing_lags)
+        if not lags:
+            return {"firings": 0}
+        return {
+            "firings": len(lags),
+            "last_ms": self._lag_ms(self.firing_lags[-1]),
+            "p95_ms": self._lag_ms(lags[min(len(lags) - 1, int(len(lags) * 0.95))]),
+            "max_ms": self._lag_ms(lags[-1]),
+        }
     
     def get_scheduler_status(self):
         """Get current scheduler status for monitoring."""
         status = {
             'schedule_loaded': bool(self.schedule),
-            'weekdays_configured': len(self.schedule.get('weekdays', {})),
-            'special_dates_configured': len(self.schedule.get('special_dates', {})),
+            'weekdays_configured': len(self.schedule.weekdays),
+            'special_dates_configured': len(self.schedule.special_dates),
             'commands_available': len(self.commands),
             'states_available': len(self.states),
             'next_action': self.next_action,
-            'next_action_time': self.next_action_time.isoformat() if self.next_action_time else None
+            'next_action_time': self.next_action_time.isoformat() if self.next_action_time else None,
+            'clock': self.clock_monitor.get_status() if self.clock_monitor else None,
+            'timezone': str(self.tz_resolver.tz)
         }
         return status
     
+    def get_health(self):
+        """Scheduler part of the heartbeat report: next firing and age of the last good execution."""
+        now = self.clock.now()
+        return {
+            "next_action": self.next_action,
+            "next_firing": self.next_action_time.isoformat() if self.next_action_time else None,
+            "last_success": self.last_success_time.isoformat() if self.last_success_time else None,
+            "secs_since_last_success": round(now.timestamp() - self.last_success_time.timestamp(), 1) if self.last_success_time else None,
+            "execution_queue_depth": self._execution_queue.qsize(),
+            "firing_lag": self.get_firing_lag_stats(),
+        }
+
     def get_today_schedule(self):
         """Get today's complete schedule for debugging and monitoring."""
-        now = datetime.now()
+        now = self.clock.now()
         current_date_str = now.strftime('%d-%m-%Y')
         current_weekday = now.weekday()
         
         # Check for special date first
-        if current_date_str in self.schedule['special_dates']:
+        if current_date_str in self.schedule.special_dates:
             return {
                 'date': current_date_str,
                 'type': 'special',
-                'items': self.schedule['special_dates'][current_date_str]
+                'items': self.schedule.special_dates[current_date_str].to_items(now.date(), self.solar_table)
             }
         
         # Get weekday schedule
-        if current_weekday in self.schedule['weekdays']:
+        if current_weekday in self.schedule.weekdays:
             weekday_names = ['lunedì', 'martedì', 'mercoledì', 'giovedì', 'venerdì', 'sabato', 'domenica']
             return {
                 'date': current_date_str,
                 'type': 'weekday',
                 'weekday': weekday_names[current_weekday],
-                'items': self.schedule['weekdays'][current_weekday]
+                'items': self.schedule.weekdays[current_weekday].to_items(now.date(), self.solar_table)
             }
         
         return None
@@ -359,65 +898,77 @@ class ScheduleInterpreter:
             with open(self.schedule_config, 'r', encoding='utf-8') as f:
                 return f.read()
         except FileNotFoundError:
-            logger.error(f"Schedule config file not found: {self.schedule_config}")
+            logger.error("Schedule config file not found: %s", self.schedule_config)
             return ""
         except Exception as e:
-            logger.error(f"Error reading schedule config file: {e}")
+            logger.error("Error reading schedule config file: %s", e)
             return ""
 
     def get_next_actions(self):
         """Get the next three actions with date, time, action, commands and state description."""
         next_actions = []
-        now = datetime.now()
-        
-        # Look for the next 3 actions across multiple days if needed
-        search_date = now
-        actions_found = 0
+        now = self.clock.now()
         max_days_search = 30  # Limit search to avoid infinite loops
-        days_searched = 0
-        
-        while actions_found < 3 and days_searched < max_days_search:
-            current_date_str = search_date.strftime('%d-%m-%Y')
-            current_weekday = search_date.weekday()
-            current_time = search_date.time() if search_date.date() == now.date() else time(0, 0)
-            
-            schedule_items = []
-            
-            # Check for special date first (overrides weekday)
-            if current_date_str in self.schedule['special_dates']:
-                schedule_items = self.schedule['special_dates'][current_date_str]
-            elif current_weekday in self.schedule['weekdays']:
-                schedule_items = self.schedule['weekdays'][current_weekday]
-            
-            # Find actions for this day
-            for item in schedule_items:
-                if item['time'] > current_time or search_date.date() > now.date():
-                    if actions_found >= 3:
-                        break
-                        
-                    action_datetime = datetime.combine(search_date.date(), item['time'])
-                    
-                    # Get state information
-                    state_info = self._get_state_info(item['action'])
-                    
-                    action_data = {
-                        'date': current_date_str,
-                        'time': item['time'].strftime('%H:%M'),
-                        'datetime': action_datetime.isoformat(),
-                        'action': item['action'],
-                        'commands': state_info.get('commands', []),
-                        'description': state_info.get('description', '')
-                    }
-                    
-                    next_actions.append(action_data)
-                    actions_found += 1
-            
-            # Move to next day
-            search_date += timedelta(days=1)
-            days_searched += 1
-        
+
+        # Look for the next 3 actions across multiple days if needed
+        for execution_time, action_id in self._iter_occurrences(now, max_days_search):
+            action = self.schedule.actions[action_id]
+
+            # Get state information
+            state_info = self._get_state_info(action)
+
+            action_data = {
+                'date': execution_time.strftime('%d-%m-%Y'),
+                'time': execution_time.strftime('%H:%M'),
+                'datetime': execution_time.isoformat(),
+                'action': action,
+                'commands': state_info.get('commands', []),
+                'description': state_info.get('description', '')
+            }
+
+            next_actions.append(action_data)
+            if len(next_actions) >= 3:
+                break
+
         return next_actions
 
+    def get_occurrences(self, first_day, last_day):
+        """Get every occurrence between two local dates (inclusive) in columnar form.
+
+        Actions are interned: action_ids index into the actions list, timestamps are epoch seconds.
+        """
+        if last_day < first_day:
+            raise ValueError(f"Invalid range: {first_day} is after {last_day}")
+        days = (last_day - first_day).days + 1
+        if days > MAX_OCCURRENCES_DAYS:
+            raise ValueError(f"Range too long: {days} days, at most {MAX_OCCURRENCES_DAYS} are allowed")
+
+        cache_key = (first_day, last_day)
+        if cache_key in self._occurrences_cache:
+            self._occurrences_cache.move_to_end(cache_key)
+            return self._occurrences_cache[cache_key]
+
+        timestamps = []
+        occurrence_actions = []
+        for execution_time, action_id in self._iter_day_occurrences(first_day, days):
+            timestamps.append(int(execution_time.timestamp()))
+            occurrence_actions.append(action_id)
+
+        occurrences = {
+            'from': first_day.isoformat(),
+            'to': last_day.isoformat(),
+            'timezone': str(self.tz_resolver.tz),
+            'schedule_hash': self._schedule_hash,
+            'actions': list(self.schedule.actions),
+            'timestamps': timestamps,
+            'action_ids': occurrence_actions
+        }
+
+        self._occurrences_cache[cache_key] = occurrences
+        if len(self._occurrences_cache) > OCCURRENCES_CACHE_SIZE:
+            self._occurrences_cache.popitem(last=False)
+        return occurrences
+
     def get_last_executed_action(self):
         """Get the last executed action with all details."""
         if not self.last_executed_action or not self.last_executed_time:
@@ -436,9 +987,16 @@ class ScheduleInterpreter:
             'datetime': self.last_executed_time.isoformat(),
             'action': self.last_executed_action,
             'commands': state_info.get('commands', []),
-            'description': state_info.get('description', '')
+            'description': state_info.get('description', ''),
+            'delivery': self.last_delivery
         }
     
+    def get_execution_history(self, start=None, end=None, cursor=None, limit=50):
+        """Get a page of executed states from the journal, optionally limited to a time range."""
+        if self.execution_journal is None:
+            return {'records': [], 'next_cursor': None, 'total': 0}
+        return self.execution_journal.query(start, end, cursor, limit)
+
     def get_validation_report(self):
         """Get a report of all actions and their validation status."""
         validation_report = {
@@ -451,20 +1009,10 @@ class ScheduleInterpreter:
         has_commands = bool(self.commands)
         has_states = bool(self.states)
         
-        # Collect all actions from schedule
-        all_actions = set()
-        
-        # From weekdays
-        for day_schedule in self._validation_schedule.get('weekdays', {}).values():
-            for item in day_schedule:
-                all_actions.add(item['action'])
-        
-        # From special dates
-        for date_schedule in self._validation_schedule.get('special_dates', {}).values():
-            for item in date_schedule:
-                all_actions.add(item['action'])
+        # Collect all actions from schedule, the action table holds each of them once
+        all_actions = set(self._validation_schedule.actions)
         
-        # Validate each unique action
+        # Validity is kept up to date by states list updates, see _revalidate_actions
         for action in all_actions:
             # It's a state
             if not has_states:
@@ -472,13 +1020,14 @@ class ScheduleInterpreter:
                     'action': action,
                     'reason': 'States list not loaded'
                 })
-            elif self._is_state_valid(action):
-                validation_report['valid_actions'].append(action)
-            else:
+            elif action in self.flagged_actions:
                 validation_report['invalid_actions'].append({
                     'action': action,
-                    'reason': f'State "{action}" not found in states list'
+                    'reason': self.flagged_actions[action],
+                    'entries': self._describe_action_entries(self._validation_schedule, action)
                 })
+            else:
+                validation_report['valid_actions'].append(action)
         
         return validation_report
     
@@ -507,149 +1056,81 @@ class ScheduleInterpreter:
                     return True
         return False
     
-    def _store_schedule_section(self, section_name, schedule_items, schedule):
-        """Store schedule items in the appropriate section."""
-        # Sort by time
-        schedule_items.sort(key=lambda x: x['time'])
-        
-        if self._is_special_date(section_name):
-            self._validate_date_format(section_name)
-            schedule['special_dates'][section_name] = schedule_items
-        else:
-            # Map Italian weekday names to Python weekday numbers
-            weekday_map = {
-                'domenica': 6, 'lunedì': 0, 'martedì': 1, 'mercoledì': 2,
-                'giovedì': 3, 'venerdì': 4, 'sabato': 5
-            }
-            weekday_num = weekday_map.get(section_name.lower())
-            if weekday_num is not None:
-                schedule['weekdays'][weekday_num] = schedule_items
-            else:
-                logger.warning(f"Unknown section name '{section_name}', skipping storage")
+    def _format_diagnostic(self, diagnostic):
+        location = f"line {diagnostic['line']}" if diagnostic['line'] else "schedule"
+        if diagnostic['section']:
+            location += f" [{diagnostic['section']}]"
+        if diagnostic['time']:
+            location += f" {diagnostic['time']}"
+        return f"{location}: {diagnostic['reason']}"
 
-    def _load_schedule(self, file_path, schedule):
-        """Parse the schedule file to handle duplicates and edge cases."""
-        current_section = None
-        schedule_items = []
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                original_line = line
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    continue
-                
-                # Check for section headers
-                if line.startswith('[') and line.endswith(']'):
-                    # Store previous section if exists
-                    if current_section and schedule_items:
-                        self._store_schedule_section(current_section, schedule_items, schedule)
-                    
-                    # Start new section
-                    current_section = line[1:-1]
-                    schedule_items = []
-                    #logger.debug(f"Starting section: {current_section}")
-                    continue
-                
-                # Parse time and action lines
-                if current_section:
-                    try:
-                        # Look for time pattern at the beginning of the line
-                        time_pattern = re.match(r'^(\d{1,2}:\d{1,2})\s*(.*)', line)
-                        if time_pattern:
-                            time_str = time_pattern.group(1)
-                            action = time_pattern.group(2).strip()
-                        else:
-                            # Fallback to simple split
-                            parts = line.split(' ', 1)
-                            if len(parts) >= 2:
-                                time_str = parts[0]
-                                action = parts[1].strip()
-                            elif len(parts) == 1 and ':' in parts[0]:
-                                time_str = parts[0]
-                                action = ''
-                            else:
-                                logger.warning(f"Skipping malformed line {line_num}: {original_line}")
-                                continue
-                        
-                        # Validate and parse time
-                        if self._validate_time_format(time_str):
-                            time_obj = self._parse_time(time_str)
-                            
-                            # Check for duplicates in this section
-                            duplicate = any(item['time'] == time_obj for item in schedule_items)
-                            if duplicate:
-                                logger.warning(f"Duplicate time {time_str} in section {current_section}, line {line_num} - skipping")
-                                continue
-                                
-                            self._validate_action(action, current_section, time_str)
-                            
-                            schedule_items.append({
-                                'time': time_obj,
-                                'action': action,
-                                'raw_time': time_str
-                            })
-                            #logger.debug(f"Added schedule item: {time_str} -> {action}")
-                        else:
-                            #logger.warning(f"Invalid time format on line {line_num}: {time_str}")
-                            raise ValueError(f"Invalid time format on line {line_num}: {time_str}")
-
-                    except Exception as e:
-                        raise ValueError(f"Failed to parse line {line_num}: '{original_line}' - {e}")
-                        #logger.warning(f"Failed to parse line {line_num}: '{original_line}' - {e}")
-        
-        # Store the last section
-        if current_section and schedule_items:
-            self._store_schedule_section(current_section, schedule_items, schedule)
-        
-        logger.info(f"Schedule loaded successfully. Weekdays: {len(schedule['weekdays'])}, Special dates: {len(schedule['special_dates'])}")
-    
-    def _validate_schedule_file(self, file_path):
-        # Initialize empty schedule for validation
-        self._validation_schedule = {'weekdays': {}, 'special_dates': {}}
+    def _state_names(self):
+        """Snapshot of the known state names, None while the states list is not loaded."""
+        if not self.states:
+            return None
+        if isinstance(self.states, dict):
+            return frozenset(self.states)
+        return frozenset(state.get('name') if isinstance(state, dict) else state for state in self.states)
+
+    def _compile_schedule(self, content):
+        """Parse schedule content against the current states list, see compile_schedule."""
+        return compile_schedule(content, self._state_names(), self.solar_table is not None)
+
+    async def _compile_schedule_offloaded(self, content):
+        """Compile uploaded content, in a worker process when it is large enough to stall the loop.
+
+        The worker gets the content and a snapshot of the state names, and returns the finished
+        compiled schedule, so nothing is shared with the loop while it runs.
+        """
+        state_names = self._state_names()
+        solar = self.solar_table is not None
+        if len(content) < self.compile_process_threshold:
+            return compile_schedule(content, state_names, solar)
 
         try:
-            self._load_schedule(file_path, self._validation_schedule)
+            if self._compile_pool is None:
+                self._compile_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("forkserver"))
+            return await asyncio.get_running_loop().run_in_executor(self._compile_pool, compile_schedule, content, state_names, solar)
+        except BrokenProcessPool as e:
+            logger.warning("Schedule compiler process failed (%s), compiling in a thread", e)
+            self._compile_pool = None
+            return await asyncio.to_thread(compile_schedule, content, state_names, solar)
 
-            # Check that all weekdays are present
-            found_weekdays = set(self._validation_schedule.get('weekdays', {}).keys())
-            expected_weekdays = set(range(7))  # 0-6 for Monday-Sunday
-            
-            if len(found_weekdays) < 7:
-                missing = expected_weekdays - found_weekdays
-                logger.warning(f"Missing weekdays: {missing}")
-            
-            logger.info("Schedule file validation completed")
-            
-            # Keep the loaded schedule since validation passed
-            return True
-            
-        except Exception as e:
-            raise ValueError(f"Validation failed: {e}")
-    
-    def _validate_action(self, action, section_name, time_str):
-        """Validate action against commands or states lists."""
-        # Only validate if we have the states list loaded
-        if self.states:
-            # Check if state exists in states list
-            state_found = False
-            for state in self.states:
-                if isinstance(state, dict):
-                    if state.get('name') == action:
-                        state_found = True
-                        break
-                elif isinstance(state, str) and state == action:
-                    state_found = True
-                    break
-            
-            if not state_found:
-                raise ValueError(f"State '{action}' not found in states list for time slot {time_str} in section {section_name}")
-        else:
-            raise ValueError(f"States list not loaded, cannot validate state '{action}' at time {time_str} in section {section_name}")
-            #logger.debug(f"States list not loaded, skipping validation for state '{action}'")
+    def shutdown_compiler(self):
+        """Stop the schedule compiler process, if it was started."""
+        if self._compile_pool is not None:
+            self._compile_pool.shutdown(wait=False, cancel_futures=True)
+            self._compile_pool = None
+
+    async def validate_schedule(self, content):
+        """Validate schedule content without applying it, reporting every problem found."""
+        _schedule, diagnostics = await self._compile_schedule_offloaded(content)
+        errors = [d for d in diagnostics if d['level'] == 'error']
+        return {
+            'valid': not errors,
+            'errors': len(errors),
+            'warnings': len(diagnostics) - len(errors),
+            'diagnostics': diagnostics
+        }
 
+    def _load_schedule(self, file_path, content=None):
+        """Parse the schedule file to handle duplicates and edge cases, returning the compiled schedule."""
+        if content is None:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+        compiled, diagnostics = self._compile_schedule(content)
+        errors = [d for d in diagnostics if d['level'] == 'error']
+        for diagnostic in diagnostics:
+            if diagnostic['level'] == 'warning':
+                logger.warning("%s %s", file_path, self._format_diagnostic(diagnostic))
+        if errors:
+            more = f" (and {len(errors) - 1} more errors)" if len(errors) > 1 else ""
+            raise ValueError(f"Failed to parse {self._format_diagnostic(errors[0])}{more}")
+
+        logger.info("Schedule loaded successfully. Weekdays: %s, Special dates: %s", len(compiled.weekdays), len(compiled.special_dates))
+        return compiled
+    
     def _get_state_info(self, state_name):
         """Get detailed information about a state including commands and description."""
         if not self.states:
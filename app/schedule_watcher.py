@@ -0,0 +1,126 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from os import path
+from dunebugger_logging import logger
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+INOTIFY_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class ScheduleFileWatcher:
+    """Watch schedule.conf for external edits and hot-reload it into the scheduler.
+
+    Uses inotify on the config folder when available (so atomic replaces are seen too),
+    and falls back to polling the file stat otherwise.
+    """
+
+    def __init__(self, schedule_interpreter, watch_mode="auto", poll_interval=5, debounce_secs=0.5):
+        self.schedule_interpreter = schedule_interpreter
+        self.schedule_file = schedule_interpreter.schedule_config
+        self.watch_mode = watch_mode
+        self.poll_interval = poll_interval
+        self.debounce_secs = debounce_secs
+        self._changed = asyncio.Event()
+        self._inotify_fd = None
+        self._tasks = []
+
+    async def start(self):
+        """Start watching the schedule file in the background."""
+        if self.watch_mode == "off":
+            logger.info("Schedule file watcher disabled")
+            return
+
+        if self.watch_mode in ["auto", "inotify"] and self._start_inotify():
+            logger.info(f"Watching {self.schedule_file} for changes (inotify)")
+        else:
+            self._tasks.append(asyncio.create_task(self._poll_loop()))
+            logger.info(f"Watching {self.schedule_file} for changes (polling every {self.poll_interval} seconds)")
+
+        self._tasks.append(asyncio.create_task(self._reload_loop()))
+
+    async def stop(self):
+        """Stop watching and release the inotify descriptor."""
+        if self._inotify_fd is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def _start_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+            # Watch the folder rather than the file, the file inode changes on every atomic replace
+            watch_dir = path.dirname(self.schedule_file).encode()
+            if libc.inotify_add_watch(fd, watch_dir, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+                error = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(error, "inotify_add_watch failed")
+
+            asyncio.get_running_loop().add_reader(fd, self._on_inotify_event)
+            self._inotify_fd = fd
+            return True
+        except Exception as e:
+            logger.debug(f"inotify not available, falling back to polling: {e}")
+            return False
+
+    def _on_inotify_event(self):
+        try:
+            data = os.read(self._inotify_fd, 4096)
+        except BlockingIOError:
+            return
+
+        file_name = path.basename(self.schedule_file).encode()
+        offset = 0
+        while offset + INOTIFY_EVENT_HEADER.size <= len(data):
+            _wd, _mask, _cookie, name_length = INOTIFY_EVENT_HEADER.unpack_from(data, offset)
+            offset += INOTIFY_EVENT_HEADER.size
+            name = data[offset : offset + name_length].rstrip(b"\x00")
+            offset += name_length
+            if name == file_name:
+                self._changed.set()
+
+    def _stat_signature(self):
+        try:
+            stat = os.stat(self.schedule_file)
+            return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    async def _poll_loop(self):
+        last_signature = self._stat_signature()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            signature = self._stat_signature()
+            if signature != last_signature:
+                last_signature = signature
+                self._changed.set()
+
+    async def _reload_loop(self):
+        while True:
+            await self._changed.wait()
+            # Let editors and config management finish writing before reading the file
+            await asyncio.sleep(self.debounce_secs)
+            self._changed.clear()
+            try:
+                await self.schedule_interpreter.reload_schedule_from_file()
+            except Exception as e:
+                logger.error(f"Error reloading schedule file: {e}")
@@ -0,0 +1,28 @@
+import asyncio
+from datetime import datetime
+
+
+class SystemClock:
+    """Wall clock and timers used by the scheduler.
+
+    All time reads and waits of ScheduleInterpreter go through a clock object,
+    so the simulation can swap in a virtual clock with the same interface.
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+
+    def now(self):
+        """Current time, aware in the scheduler timezone."""
+        return datetime.now(self.tz)
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    async def wait_event(self, event, timeout):
+        """Wait for event up to timeout seconds, return True if it was set."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
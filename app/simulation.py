@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Fast-forward the scheduler on a virtual clock and record what it would dispatch.
+
+Usage:
+    python simulation.py --days 365 [--start 2026-01-01] [--schedule config/schedule.conf]
+                         [--states states.json] [--output dispatches.json]
+
+Without --states, every scheduled state is simulated as a single command named after it.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import time as wall_time
+from datetime import datetime, timedelta, timezone
+from os import path
+from dunebugger_logging import logger
+from dunebugger_settings import settings
+from schedule_interpreter import ScheduleInterpreter
+from solar import SolarTable
+from state_tracker import StateTracker
+from timezone_resolver import TimezoneResolver
+
+
+class VirtualClock:
+    """Clock with the SystemClock interface whose time jumps to the next timer once every task waits.
+
+    The scheduler timer loop and its execution worker wait concurrently, so time is advanced by
+    run(), one timer at a time, after letting every runnable task reach its next wait.
+    """
+
+    # Loop iterations given to the tasks woken by a timer to reach their next wait
+    SETTLE_ITERATIONS = 20
+
+    def __init__(self, start, end):
+        self.tz = start.tzinfo
+        self._now = start
+        self.end = end
+        self._timers = []  # heap of (due timestamp, sequence, future)
+        self._sequence = 0
+
+    def now(self):
+        return self._now
+
+    def _add_timer(self, seconds):
+        timer = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._timers, (self._now.timestamp() + max(0, seconds), self._sequence, timer))
+        return timer
+
+    async def sleep(self, seconds):
+        await self._add_timer(seconds)
+
+    async def wait_event(self, event, timeout):
+        if event.is_set():
+            return True
+        timer = self._add_timer(timeout)
+        waiter = asyncio.ensure_future(event.wait())
+        waiter.add_done_callback(lambda _waiter: timer.done() or timer.set_result(None))
+        try:
+            await timer
+        finally:
+            waiter.cancel()
+        return event.is_set()
+
+    async def run(self):
+        """Fire timers in due order until the end of the simulated period."""
+        while True:
+            for _iteration in range(self.SETTLE_ITERATIONS):
+                await asyncio.sleep(0)
+            while self._timers and self._timers[0][2].done():
+                heapq.heappop(self._timers)
+            if not self._timers or self._timers[0][0] > self.end.timestamp():
+                return
+            due, _sequence, timer = heapq.heappop(self._timers)
+            # Move on the absolute timeline, so DST transitions are crossed correctly
+            self._now = datetime.fromtimestamp(max(due, self._now.timestamp()), timezone.utc).astimezone(self.tz)
+            timer.set_result(None)
+
+
+class RecordingTransport:
+    """Stand-in for MessagingQueueHandler that records every dispatch with its virtual time."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.dispatches = []
+
+    async def dispatch_message(self, message_body, subject, recipient, reply_subject=None, message_id=None, dedup_key=None):
+        self.dispatches.append({"time": self.clock.now().isoformat(), "subject": subject, "recipient": recipient, "body": message_body, "dedup_key": dedup_key})
+
+    def get_dispatches(self, subject="dunebugger_set"):
+        return [dispatch for dispatch in self.dispatches if dispatch["subject"] == subject]
+
+
+class RecordingStateTracker(StateTracker):
+    """State tracker that records each executed state instead of notifying remotes."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.schedule_interpreter = None
+        self.firings = []
+
+    def notify_update(self, attribute):
+        if attribute == "near_actions" and self.schedule_interpreter:
+            self.firings.append({"time": self.clock.now().isoformat(), "action": self.schedule_interpreter.last_executed_action})
+
+
+def run_simulation(schedule_content, states, start, days, tz_resolver=None):
+    """Run the real scheduler loop over days of virtual time starting at start.
+
+    Returns the executed states, the dunebugger_set dispatches and timing figures.
+    """
+    tz_resolver = tz_resolver or TimezoneResolver(settings.schedulerTimezone, settings.dstSkippedTimePolicy, settings.dstAmbiguousTimePolicy)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=tz_resolver.tz)
+    solar_table = None
+    if settings.latitude is not None and settings.longitude is not None:
+        solar_table = SolarTable(settings.latitude, settings.longitude, tz_resolver.tz)
+    clock = VirtualClock(start, start + timedelta(days=days))
+    transport = RecordingTransport(clock)
+    state_tracker = RecordingStateTracker(clock)
+
+    schedule_interpreter = ScheduleInterpreter(transport, state_tracker, tz_resolver=tz_resolver, clock=clock, solar_table=solar_table)
+    schedule_interpreter.states = states
+    state_tracker.schedule_interpreter = schedule_interpreter
+
+    schedule, diagnostics = schedule_interpreter._compile_schedule(schedule_content)
+    errors = [d for d in diagnostics if d["level"] == "error"]
+    if errors:
+        raise ValueError(f"Schedule is not valid: {schedule_interpreter._format_diagnostic(errors[0])}")
+    schedule_interpreter._swap_schedule(schedule, schedule_interpreter._hash_content(schedule_content))
+
+    async def simulate():
+        scheduler_task = asyncio.create_task(schedule_interpreter.run_scheduler())
+        try:
+            await clock.run()
+        finally:
+            scheduler_task.cancel()
+            try:
+                await scheduler_task
+            except asyncio.CancelledError:
+                pass
+
+    # Per-firing logging would dominate the run time
+    previous_level = logger.level
+    logger.setLevel(logging.WARNING)
+    started = wall_time.perf_counter()
+    try:
+        asyncio.run(simulate())
+    finally:
+        logger.setLevel(previous_level)
+    elapsed = wall_time.perf_counter() - started
+
+    return {
+        "start": start.isoformat(),
+        "end": clock.end.isoformat(),
+        "firings": state_tracker.firings,
+        "dispatches": transport.get_dispatches("dunebugger_set"),
+        "elapsed_secs": elapsed,
+        "firings_per_sec": len(state_tracker.firings) / elapsed if elapsed else None,
+    }
+
+
+def _placeholder_states(schedule_content):
+    """One single-command state per state name found in the schedule."""
+    states = {}
+    for line in schedule_content.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and (":" in parts[0] or parts[0].lower().startswith(("sunrise", "sunset"))) and not line.strip().startswith("#"):
+            states[parts[1]] = {"commands": [parts[1]], "description": "simulated"}
+    return states
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fast-forward the scheduler on a virtual clock")
+    parser.add_argument("--schedule", default=path.join(path.dirname(path.abspath(__file__)), "config/schedule.conf"))
+    parser.add_argument("--states", help="JSON file with the states list as sent by core")
+    parser.add_argument("--start", help="Start date/time in ISO format (default: now)")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--output", help="Write the full result as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.schedule, "r", encoding="utf-8") as f:
+        schedule_content = f.read()
+    if args.states:
+        with open(args.states, "r", encoding="utf-8") as f:
+            states = json.load(f)
+    else:
+        states = _placeholder_states(schedule_content)
+
+    start = datetime.fromisoformat(args.start) if args.start else datetime.now()
+    result = run_simulation(schedule_content, states, start, args.days)
+
+    for firing in result["firings"]:
+        print(f"{firing['time']}  {firing['action']}")
+    print(f"{len(result['firings'])} states, {len(result['dispatches'])} dunebugger_set dispatches in {result['elapsed_secs']:.3f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
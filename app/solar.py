@@ -0,0 +1,68 @@
+import calendar
+import math
+from array import array
+from datetime import date, datetime, timedelta, timezone
+
+# Solar event kinds, also used as entry kinds by the compiled schedule
+SUNRISE = 1
+SUNSET = 2
+
+NO_EVENT = -32768  # polar day or night, the event does not happen on that day
+ZENITH = math.radians(90.833)  # sun centre below the horizon, accounting for refraction and solar radius
+
+
+def _solar_event_utc_minutes(latitude, longitude, day_of_year, days_in_year):
+    """Return (sunrise, sunset) as minutes after UTC midnight, None for an event that does not happen.
+
+    NOAA general solar position approximation, accurate to a minute or two outside polar regions.
+    """
+    gamma = 2 * math.pi / days_in_year * (day_of_year - 1)
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                                 - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    declination = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+                   - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+                   - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    lat = math.radians(latitude)
+    cos_hour_angle = math.cos(ZENITH) / (math.cos(lat) * math.cos(declination)) - math.tan(lat) * math.tan(declination)
+    if not -1 <= cos_hour_angle <= 1:
+        return None, None
+    hour_angle = math.degrees(math.acos(cos_hour_angle))
+    return 720 - 4 * (longitude + hour_angle) - equation_of_time, 720 - 4 * (longitude - hour_angle) - equation_of_time
+
+
+class SolarTable:
+    """Local sunrise and sunset times at a fixed location, precomputed one year at a time.
+
+    Each year is two int16 arrays indexed by day of the year holding the local minute of
+    the day of the event, so looking an event up is an index read.
+    """
+
+    def __init__(self, latitude, longitude, tz):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.tz = tz
+        self._years = {}  # year -> {SUNRISE: array, SUNSET: array}
+
+    def _compute_year(self, year):
+        days_in_year = 366 if calendar.isleap(year) else 365
+        events = {SUNRISE: array("h"), SUNSET: array("h")}
+        for day_of_year in range(1, days_in_year + 1):
+            day = date(year, 1, 1) + timedelta(days=day_of_year - 1)
+            utc_midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            sunrise, sunset = _solar_event_utc_minutes(self.latitude, self.longitude, day_of_year, days_in_year)
+            for kind, utc_minutes in ((SUNRISE, sunrise), (SUNSET, sunset)):
+                if utc_minutes is None:
+                    events[kind].append(NO_EVENT)
+                    continue
+                local = (utc_midnight + timedelta(minutes=round(utc_minutes))).astimezone(self.tz)
+                # Minutes from the local midnight of day, the event may fall on a neighbouring local date
+                events[kind].append((local.date() - day).days * 1440 + local.hour * 60 + local.minute)
+        return events
+
+    def get_minute(self, day, kind):
+        """Return the local minute of the day of a solar event, or None if it does not happen that day."""
+        events = self._years.get(day.year)
+        if events is None:
+            events = self._years[day.year] = self._compute_year(day.year)
+        minute = events[kind][day.timetuple().tm_yday - 1]
+        return None if minute == NO_EVENT else minute
@@ -59,8 +59,8 @@ class StateTracker:
                 changed_states = self.get_changes()
                 for state in changed_states:
                     if state == "schedule":
-                        # React to GPIO state changes
-                        await self.mqueue_handler.handle_get_schedule()
+                        # Remotes get the changes, and ask for the full text if their copy is out of date
+                        await self.mqueue_handler.handle_schedule_changed()
                         await self.mqueue_handler.handle_get_next_actions()
                         await self.mqueue_handler.handle_get_last_executed_action()
                     elif state == "near_actions":
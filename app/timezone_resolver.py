@@ -0,0 +1,110 @@
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo
+from dunebugger_logging import logger
+
+
+def _system_timezone():
+    """Return the IANA timezone of the host, or UTC if it cannot be determined."""
+    try:
+        with open("/etc/localtime", "rb") as f:
+            return ZoneInfo.from_file(f, key="localtime")
+    except Exception:
+        logger.warning("Unable to determine the system timezone, using UTC")
+        return timezone.utc
+
+
+class TimezoneResolver:
+    """Resolve local schedule times to absolute instants in a configured IANA timezone.
+
+    DST transitions are precomputed for a horizon of days, so resolving a time on an
+    ordinary day is a dictionary miss and a tzinfo assignment. On transition days:
+      skipped times (spring forward) are shifted to the end of the gap, or skipped,
+      ambiguous times (fall back) resolve to the first or the last occurrence.
+    """
+
+    def __init__(self, timezone_name=None, skipped_policy="shift", ambiguous_policy="first", horizon_days=400):
+        self.tz = ZoneInfo(timezone_name) if timezone_name else _system_timezone()
+        self.skipped_policy = skipped_policy
+        self.ambiguous_policy = ambiguous_policy
+        self.horizon_days = horizon_days
+        self._horizon_start = None
+        self._horizon_end = None
+        self._transitions_by_date = {}
+        self._precompute_transitions(self.now().date() - timedelta(days=7))
+
+    def now(self):
+        """Current time, aware in the configured timezone."""
+        return datetime.now(self.tz)
+
+    def _offset_at(self, instant):
+        return instant.astimezone(self.tz).utcoffset()
+
+    def _find_transition(self, low, high):
+        """Binary search the instant, to the minute, where the UTC offset changes between low and high."""
+        low_offset = self._offset_at(low)
+        while high - low > timedelta(minutes=1):
+            middle = low + (high - low) / 2
+            if self._offset_at(middle) == low_offset:
+                low = middle
+            else:
+                high = middle
+        return high.replace(second=0, microsecond=0)
+
+    def _precompute_transitions(self, start_date):
+        """Find every offset change between start_date and the end of the horizon."""
+        self._horizon_start = start_date
+        self._horizon_end = start_date + timedelta(days=self.horizon_days)
+        self._transitions_by_date = {}
+
+        instant = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
+        offset = self._offset_at(instant)
+        for _day in range(self.horizon_days + 1):
+            next_instant = instant + timedelta(days=1)
+            next_offset = self._offset_at(next_instant)
+            if next_offset != offset:
+                transition = self._find_transition(instant, next_instant)
+                self._register_transition(transition, offset, next_offset)
+            instant, offset = next_instant, next_offset
+
+        logger.debug(f"Precomputed {len(self._transitions_by_date)} DST transition days for {self.tz} until {self._horizon_end}")
+
+    def _register_transition(self, transition, offset_before, offset_after):
+        """Index a transition by the local wall-clock window it affects."""
+        # Wall clock reading just before the transition, e.g. 02:00 when springing forward
+        wall_before = (transition + offset_before).replace(tzinfo=None)
+        delta = offset_after - offset_before
+        if delta > timedelta(0):
+            # Local times in [wall_before, wall_before + delta) do not exist
+            window = ("skipped", wall_before, wall_before + delta, transition)
+        else:
+            # Local times in [wall_before + delta, wall_before) happen twice
+            window = ("ambiguous", wall_before + delta, wall_before, transition)
+        self._transitions_by_date.setdefault(window[1].date(), []).append(window)
+
+    def _ensure_horizon(self, local_date):
+        if not self._horizon_start <= local_date < self._horizon_end:
+            self._precompute_transitions(local_date - timedelta(days=7))
+
+    def resolve(self, local_date: date, local_time):
+        """Return the aware instant for a local date and time, or None if it is skipped by policy."""
+        self._ensure_horizon(local_date)
+        local = datetime.combine(local_date, local_time)
+        for kind, window_start, window_end, transition in self._transitions_by_date.get(local_date, ()):
+            if not window_start <= local < window_end:
+                continue
+            if kind == "skipped":
+                if self.skipped_policy == "skip":
+                    return None
+                # First valid instant after the gap
+                return transition.astimezone(self.tz)
+            return local.replace(tzinfo=self.tz, fold=0 if self.ambiguous_policy == "first" else 1)
+
+        return local.replace(tzinfo=self.tz)
+
+    def get_transitions(self):
+        """Return the precomputed transitions for monitoring."""
+        return [
+            {"kind": kind, "date": transition_date.isoformat(), "from": window_start.time().isoformat(), "to": window_end.time().isoformat(), "at": transition.isoformat()}
+            for transition_date, windows in sorted(self._transitions_by_date.items())
+            for kind, window_start, window_end, transition in windows
+        ]
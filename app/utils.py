@@ -1,6 +1,29 @@
 from dunebugger_logging import logger
 import os
-import subprocess
+import ctypes
+import ctypes.util
+
+# adjtimex() return value and status bits from <sys/timex.h>
+TIME_ERROR = 5
+STA_UNSYNC = 0x0040
+STA_NANO = 0x2000
+
+
+class Timex(ctypes.Structure):
+    """struct timex, only the fields up to status are read, the rest is padding for the kernel."""
+
+    _fields_ = [
+        ("modes", ctypes.c_uint),
+        ("offset", ctypes.c_long),
+        ("freq", ctypes.c_long),
+        ("maxerror", ctypes.c_long),
+        ("esterror", ctypes.c_long),
+        ("status", ctypes.c_int),
+        ("reserved", ctypes.c_byte * 256),
+    ]
+
+
+_libc = None
 
 def is_raspberry_pi():
     try:
@@ -20,19 +43,35 @@ def validate_path(path):
     else:
         return False
 
-def check_ntp_sync():
+def read_clock_sync_status():
+    """Read the kernel time synchronisation status with adjtimex(), without changing anything.
+
+    Returns a dict with synchronized, offset_secs, max_error_secs and est_error_secs,
+    or None when the status cannot be read (e.g. not on Linux).
+    """
+    global _libc
     try:
-        # Run the timedatectl command and capture the output
-        result = subprocess.run(["timedatectl", "status"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        if result.returncode == 0:
-            # Check if NTP is synchronized
-            if "synchronized: yes" in result.stdout:
-                return True
-            else:
-                return False
-        else:
-            logger.error(f"Error running timedatectl: {result.stderr}")
-            return False
+        if _libc is None:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        timex = Timex()  # modes = 0: read only, allowed without privileges
+        state = _libc.adjtimex(ctypes.byref(timex))
+        if state < 0:
+            raise OSError(ctypes.get_errno(), "adjtimex failed")
+
+        offset_unit = 1e-9 if timex.status & STA_NANO else 1e-6
+        return {
+            "synchronized": state != TIME_ERROR and not timex.status & STA_UNSYNC,
+            "offset_secs": timex.offset * offset_unit,
+            "max_error_secs": timex.maxerror * 1e-6,
+            "est_error_secs": timex.esterror * 1e-6,
+        }
     except Exception as e:
-        logger.error(f"Error running timedatectl: ${str(e)}")
-        return False
\ No newline at end of file
+        logger.debug(f"Unable to read kernel clock status: {e}")
+        return None
+
+
+def check_ntp_sync():
+    clock_status = read_clock_sync_status()
+    if clock_status is None:
+        return False
+    return clock_status["synchronized"]